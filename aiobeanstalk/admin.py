@@ -0,0 +1,196 @@
+"""
+Bulk inspection and cleanup of buried or delayed jobs.
+
+beanstalkd can only peek at the first buried or delayed job of a tube, so
+`JobScanner` walks the job id space instead: ``stats-job`` for a whole range
+of ids is sent in one write, the jobs of the wanted tube and state are kept
+and their bodies fetched with pipelined ``peek``. Matches can then be kicked
+or deleted in batches::
+
+    python -m aiobeanstalk.admin emails list --state buried
+    python -m aiobeanstalk.admin emails kick --match 'user-42'
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.exceptions import BSNotFount
+
+STATES = ('buried', 'delayed', 'ready', 'reserved')
+
+
+class JobScanner:
+    """Finds jobs of `tube` in `state` by scanning job ids.
+
+    The scan stops once all jobs counted by ``stats-tube`` at the start are
+    found or the ids run past the last job created by the server.
+
+    :param bs: ``Beanstalk`` connection
+    :param tube: ``str`` tube name
+    :param state: ``str`` job state, one of `STATES`, or ``None`` for jobs
+        in any state
+    :param batch_size: ``int`` job ids looked up per write
+    :param start: ``int`` first job id to look at
+    :param stop: ``int`` job id to stop at, by default the ``total-jobs``
+        counter of the server
+    :param bodies: ``bool`` fetch job bodies with ``peek``
+    """
+
+    def __init__(self, bs, tube, state='buried', batch_size=1000, start=1,
+                 stop=None, bodies=True):
+        if state is not None and state not in STATES:
+            raise ValueError('Unknown job state: {}'.format(state))
+        self._bs = bs
+        self.tube = tube
+        self.state = state
+        self.batch_size = batch_size
+        self.next_jid = start
+        self.stop = stop
+        self.bodies = bodies
+        self.expected = None
+        self.found = 0
+
+    @property
+    def done(self):
+        return (self.expected is not None and
+                (self.found >= self.expected or self.next_jid > self.stop))
+
+    async def _prepare(self):
+        server, tube = await self._bs.pipeline([
+            handlers.process_stats(),
+            handlers.process_stats_tube(self.tube)])
+        if self.stop is None:
+            self.stop = server['data']['total-jobs']
+        states = STATES if self.state is None else (self.state,)
+        self.expected = sum(tube['data']['current-jobs-{}'.format(state)]
+                            for state in states)
+
+    async def next_batch(self):
+        """Return the next list of matching jobs, an empty list means the
+        scan is over. Every job is a ``dict`` with ``jid``, ``stats`` and,
+        if requested, ``data``."""
+        if self.expected is None:
+            await self._prepare()
+        while not self.done:
+            first = self.next_jid
+            last = min(first + self.batch_size, self.stop + 1)
+            self.next_jid = last
+            jobs = await self._lookup(range(first, last))
+            if jobs:
+                return jobs
+        return []
+
+    async def _lookup(self, jids):
+        replies = await self._bs.pipeline(
+            [handlers.process_stats_job(jid) for jid in jids],
+            return_exceptions=True)
+        jobs = []
+        for jid, reply in zip(jids, replies):
+            if isinstance(reply, BSNotFount):
+                continue
+            if isinstance(reply, Exception):
+                raise reply
+            stats = reply['data']
+            # yaml turns numeric tube names into numbers
+            if (str(stats['tube']) == self.tube and
+                    self.state in (None, stats['state'])):
+                jobs.append({'jid': jid, 'stats': stats})
+        self.found += len(jobs)
+        if self.bodies and jobs:
+            replies = await self._bs.pipeline(
+                [handlers.process_peek(job['jid']) for job in jobs],
+                return_exceptions=True)
+            for job, reply in zip(jobs, replies):
+                job['data'] = None if isinstance(reply, Exception) \
+                    else reply['data']
+        return jobs
+
+
+async def kick_jobs(bs, jids):
+    """Kick jobs by id with one write, returns the number of jobs kicked."""
+    replies = await bs.pipeline(
+        [handlers.process_kick_job(jid) for jid in jids],
+        return_exceptions=True)
+    return sum(1 for reply in replies if not isinstance(reply, Exception))
+
+
+async def delete_jobs(bs, jids):
+    """Delete jobs by id with one write, returns the number of jobs
+    deleted."""
+    replies = await bs.pipeline(
+        [handlers.process_delete(jid) for jid in jids],
+        return_exceptions=True)
+    return sum(1 for reply in replies if not isinstance(reply, Exception))
+
+
+ACTIONS = {'kick': kick_jobs, 'delete': delete_jobs}
+
+
+async def process_jobs(bs, tube, state='buried', predicate=None,
+                       action=None, out=None, **options):
+    """Scan jobs of `tube` in `state`, apply `action` (``'list'``,
+    ``'kick'`` or ``'delete'``) to those matching `predicate` and return
+    the number of jobs acted upon."""
+    scanner = JobScanner(bs, tube, state, **options)
+    count = 0
+    while True:
+        jobs = await scanner.next_batch()
+        if not jobs:
+            return count
+        jobs = [job for job in jobs if predicate is None or predicate(job)]
+        if out is not None:
+            for job in jobs:
+                out.write('{jid}\t{pri}\t{age}\t{data!r:.80}\n'.format(
+                    jid=job['jid'], pri=job['stats']['pri'],
+                    age=job['stats']['age'], data=job.get('data')))
+        if action in ACTIONS:
+            count += await ACTIONS[action](
+                bs, [job['jid'] for job in jobs])
+        else:
+            count += len(jobs)
+
+
+ARGS = argparse.ArgumentParser(description="Inspect, kick or delete jobs.")
+ARGS.add_argument('tube')
+ARGS.add_argument('action', choices=['list', 'kick', 'delete'])
+ARGS.add_argument('--state', choices=STATES, default='buried')
+ARGS.add_argument('--match', help='only jobs whose body matches the regex')
+ARGS.add_argument('--start', type=int, default=1, help='first job id')
+ARGS.add_argument('--stop', type=int, default=None, help='last job id')
+ARGS.add_argument('--batch', type=int, default=1000,
+                  help='job ids looked up per write')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+
+
+def main(argv=None):
+    args = ARGS.parse_args(argv)
+    predicate = None
+    if args.match:
+        pattern = re.compile(args.match)
+
+        def predicate(job):
+            return (job['data'] is not None and
+                    pattern.search(job['data']) is not None)
+
+    async def run():
+        async with connect(args.host, args.port) as bs:
+            return await process_jobs(
+                bs, args.tube, args.state, predicate, args.action,
+                out=sys.stdout if args.action == 'list' else None,
+                batch_size=args.batch, start=args.start, stop=args.stop,
+                bodies=args.action == 'list' or predicate is not None)
+
+    started = time.monotonic()
+    count = asyncio.run(run())
+    print('{} jobs {} in {:.1f}s'.format(
+        count, {'list': 'found', 'kick': 'kicked', 'delete': 'deleted'}
+        [args.action], time.monotonic() - started), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
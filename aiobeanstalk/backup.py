@@ -0,0 +1,167 @@
+"""
+Streaming export and import of tube contents.
+
+Jobs are exported with their priority, remaining delay and ttr into a compact
+length-prefixed file and imported with pipelined puts, so moving a tube
+between servers costs a few round trips per thousand jobs::
+
+    python -m aiobeanstalk.backup export emails emails.bsdump
+    python -m aiobeanstalk.backup import emails emails.bsdump --port 11301
+
+By default jobs are only peeked at and stay on the server. With ``--move``
+ready jobs are reserved in batches, written out and then deleted, jobs in
+other states are left alone. Buried jobs are imported as ready jobs.
+
+File format: ``BSDUMP1\\n`` followed by records of ``pri``, ``delay``,
+``ttr`` and body ``length`` (4 x uint32, big endian), each followed by the
+body.
+"""
+import argparse
+import asyncio
+import itertools
+import struct
+import sys
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.admin import JobScanner, STATES
+from aiobeanstalk.bsclient import connect
+
+MAGIC = b'BSDUMP1\n'
+_RECORD = struct.Struct('>IIII')
+
+
+def write_job(f, data, pri=1, delay=0, ttr=60):
+    body = data.encode() if isinstance(data, str) else data
+    f.write(_RECORD.pack(pri, delay, ttr, len(body)))
+    f.write(body)
+
+
+def read_jobs(f):
+    """Yield ``(data, pri, delay, ttr)`` of the jobs in file `f`."""
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a job dump')
+    while True:
+        header = f.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return
+        pri, delay, ttr, length = _RECORD.unpack(header)
+        body = f.read(length)
+        if len(body) < length:
+            raise ValueError('Truncated job dump')
+        yield body.decode(), pri, delay, ttr
+
+
+def job_args(stats):
+    """``(pri, delay, ttr)`` to put a copy of the job described by the
+    ``stats-job`` reply `stats`, delayed jobs keep their remaining delay."""
+    delay = stats['time-left'] if stats['state'] == 'delayed' else 0
+    return stats['pri'], delay, stats['ttr']
+
+
+async def _peek_jobs(bs, tube, out, state, batch_size):
+    scanner = JobScanner(bs, tube, state, batch_size=batch_size)
+    count = 0
+    while True:
+        jobs = await scanner.next_batch()
+        if not jobs:
+            return count
+        for job in jobs:
+            # the job went away between stats-job and peek
+            if job['data'] is None:
+                continue
+            write_job(out, job['data'], *job_args(job['stats']))
+            count += 1
+
+
+async def _move_jobs(bs, tube, out, batch_size):
+    await bs.watch(tube)
+    if tube != 'default':
+        await bs.ignore('default')
+    count = 0
+    while True:
+        jobs = await bs.reserve_many(batch_size, timeout=0)
+        if not jobs:
+            return count
+        replies = await bs.pipeline(
+            [handlers.process_stats_job(job['jid']) for job in jobs])
+        for job, reply in zip(jobs, replies):
+            write_job(out, job['data'], *job_args(reply['data']))
+        # jobs are deleted only once they are safely written out
+        out.flush()
+        await bs.delete_many([job['jid'] for job in jobs])
+        count += len(jobs)
+
+
+async def export_tube(bs, tube, out, move=False, state=None, batch_size=1000):
+    """Write the jobs of `tube` to the binary file `out`, returns the
+    number of jobs written.
+
+    :param move: ``bool`` reserve and delete ready jobs instead of peeking
+        at jobs, the connection is left watching `tube` only
+    :param state: ``str`` only peek at jobs in this state, see `STATES`
+    :param batch_size: ``int`` jobs or job ids handled per write
+    """
+    out.write(MAGIC)
+    if move:
+        return await _move_jobs(bs, tube, out, batch_size)
+    return await _peek_jobs(bs, tube, out, state, batch_size)
+
+
+async def import_jobs(bs, tube, f, batch_size=1000):
+    """Put the jobs of the binary file `f` into `tube`, returns the number
+    of jobs put."""
+    jobs = read_jobs(f)
+    count = 0
+    while True:
+        batch = [(tube,) + job for job in itertools.islice(jobs, batch_size)]
+        if not batch:
+            return count
+        await bs.publish_batch(batch)
+        count += len(batch)
+
+
+ARGS = argparse.ArgumentParser(description="Export or import tube contents.")
+ARGS.add_argument('action', choices=['export', 'import'])
+ARGS.add_argument('tube')
+ARGS.add_argument('file', help="dump file, '-' for stdin or stdout")
+ARGS.add_argument('--move', action='store_true',
+                  help='delete exported ready jobs from the server')
+ARGS.add_argument('--state', choices=STATES, default=None,
+                  help='only export jobs in this state')
+ARGS.add_argument('--batch', type=int, default=1000,
+                  help='jobs handled per write')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+
+
+def main(argv=None):
+    args = ARGS.parse_args(argv)
+    export = args.action == 'export'
+    if args.file == '-':
+        f = sys.stdout.buffer if export else sys.stdin.buffer
+    else:
+        f = open(args.file, 'wb' if export else 'rb')
+
+    async def run():
+        async with connect(args.host, args.port) as bs:
+            if export:
+                return await export_tube(
+                    bs, args.tube, f, args.move, args.state, args.batch)
+            return await import_jobs(bs, args.tube, f, args.batch)
+
+    started = time.monotonic()
+    try:
+        count = asyncio.run(run())
+    finally:
+        if args.file == '-':
+            f.flush()
+        else:
+            f.close()
+    print('{} jobs {} in {:.1f}s'.format(
+        count, 'exported' if export else 'imported',
+        time.monotonic() - started), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
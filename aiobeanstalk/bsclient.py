@@ -2,64 +2,311 @@ import asyncio
 import collections
 
 from aiobeanstalk import handlers
-from aiobeanstalk.helpers import check_error
+from aiobeanstalk.exceptions import BSTimedOut, BSDeadlineSoon
+from aiobeanstalk.helpers import check_name, parse_address, tune_socket
 from aiobeanstalk.log import logger
+from aiobeanstalk.protocol import Connection
 
 
-@asyncio.coroutine
-def connect(host='localhost', port=11300, loop=None):
-    """Connect to beanstalk server, and return instance of
-    `BeanstalkProtocol`
+def connect(host='localhost', port=11300, **options):
+    """Connect to beanstalk server. The result can be awaited for a
+    `Beanstalk` connection or used as an async context manager that closes
+    the connection on exit::
 
-    :param host: ``str`` beanstalkd server host
+        async with connect('localhost', 11300) as bs:
+            await bs.put('{"nice":"job"}')
+
+    :param host: ``str`` beanstalkd server host, a url such as
+        ``beanstalk://host:port`` or ``unix:///run/beanstalkd.sock``, or the
+        path of a unix socket
     :param port: ``int`` beanstalkd server port
-    :param loop:  ``EventLoop`` current event loop
+    :param options: socket options: ``nodelay`` (default ``True``),
+        ``keepalive``, ``sndbuf`` and ``rcvbuf``
     """
-    loop = loop or asyncio.get_event_loop()
-    bs = yield from Beanstalk.connect(host, port, loop=loop)
+    return _ConnectContext(_connect(host, port, options))
+
+
+async def _connect(host, port, options):
+    bs = await Beanstalk.connect(host, port, **options)
     logger.debug("Connection established on: {}:{}".format(host, port))
     return bs
 
 
+class _ConnectContext:
+    """Awaitable result of `connect`, doubling as async context manager."""
+
+    __slots__ = ('_coro', '_bs')
+
+    def __init__(self, coro):
+        self._coro = coro
+        self._bs = None
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self):
+        self._bs = await self._coro
+        return self._bs
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._bs.close()
+
+
 class Beanstalk:
 
     def __init__(self, reader, writer):
         self.reader, self.writer = reader, writer
-        self._queue = collections.deque()
+        # parses replies and matches them with the futures of the commands
+        self._conn = Connection()
+        # reads replies while commands are waiting, started on demand
+        self._reader_task = None
+        self._closed = False
+        # optional wire traffic recorder, see aiobeanstalk.capture
+        self.recorder = None
 
     def __getattr__(self, attr):
+        # attributes that are not set and special names are not commands
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
         def caller(*args, **kw):
             h = getattr(handlers, 'process_{}'.format(attr))
             return self._cmd(*h(*args, **kw))
         return caller
 
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
     def _cmd(self, command, handler=None):
-        self._queue.append(handler)
-        self.writer.write(command.encode())
-        return asyncio.Task(self._read_response())
+        return self._cmd_many([(command, handler)])[0]
 
-    @classmethod
-    @asyncio.coroutine
-    def connect(cls, host, port, loop):
-        reader, writer = yield from asyncio.open_connection(host, port, loop=loop)
-        return cls(reader, writer)
+    def _cmd_many(self, commands):
+        if self._closed:
+            raise ConnectionError('Connection is closed')
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in commands]
+        data = self._conn.send(commands, futures)
+        self.writer.write(data)
+        if self.recorder is not None:
+            self.recorder.command(data)
+        if self._reader_task is None:
+            self._reader_task = loop.create_task(self._read_replies())
+        return futures
+
+    async def close(self):
+        """Flush pending writes and close the connection. Commands still
+        waiting for their reply fail with ``ConnectionError``."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self._fail(ConnectionError('Connection is closed'))
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def _fail(self, exc):
+        for fut in self._conn.clear():
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def pipeline(self, commands, return_exceptions=False):
+        """Send several commands with a single write and wait for all
+        replies.
 
-    @asyncio.coroutine
-    def _read_response(self):
-        # parse the data received as server response
-        status_raw = yield from self.reader.readline()
-        spl = status_raw.decode('utf8').split()
-        status, values = spl[0], spl[1:]
-
-        check_error(status)
-
-        handler = self._queue.popleft()
-        if handler.lookup[status].has_data:
-            size = int(values[-1])
-            # read the body including the terminating two bytes of crlf
-            body = yield from self.reader.readexactly(size + 2)
-            reply = handler((status_raw + body).decode())
+        :param commands: ``list`` of ``(command, handler)`` pairs as returned
+            by ``handlers.process_*`` functions
+        :param return_exceptions: ``bool`` if true, server errors are returned
+            in place of the reply instead of being raised
+        :return: ``list`` of replies in the order of `commands`
+        """
+        if not commands:
+            return []
+        return await asyncio.gather(*self._cmd_many(commands),
+                                    return_exceptions=return_exceptions)
+
+    async def reserve_many(self, max_jobs, timeout=None):
+        """Reserve up to `max_jobs` jobs in two round trips.
+
+        One (blocking) reserve waits for the first job, then
+        ``reserve-with-timeout 0`` is sent ``max_jobs - 1`` times with a
+        single write and every job that was ready is added to the batch.
+
+        :param max_jobs: ``int`` batch size limit
+        :param timeout: ``int`` seconds to wait for the first job, forever
+            if ``None``
+        :return: ``list`` of reserved jobs, empty if `timeout` expired
+        """
+        if timeout is None:
+            first = await self.reserve()
+        else:
+            try:
+                first = await self.reserve_with_timeout(timeout)
+            except BSTimedOut:
+                return []
+        jobs = [first]
+        if max_jobs > 1:
+            commands = [handlers.process_reserve_with_timeout(0)
+                        for _ in range(max_jobs - 1)]
+            replies = await self.pipeline(commands, return_exceptions=True)
+            error = None
+            for reply in replies:
+                # TIMED_OUT means no more ready jobs, DEADLINE_SOON that a
+                # job of the batch is about to expire
+                if isinstance(reply, (BSTimedOut, BSDeadlineSoon)):
+                    continue
+                if isinstance(reply, Exception):
+                    error = error or reply
+                elif reply['state'] == 'ok':
+                    jobs.append(reply)
+            if error is not None:
+                logger.warning("Batch reserve got {!r} after {} jobs"
+                               .format(error, len(jobs)))
+        return jobs
+
+    def delete_many(self, jids):
+        """Delete jobs with a single write. Returns a coroutine with the
+        replies, errors such as ``NOT_FOUND`` are returned in place."""
+        commands = [handlers.process_delete(jid) for jid in jids]
+        return self.pipeline(commands, return_exceptions=True)
+
+    async def watch_many(self, tubes):
+        """Watch all `tubes` with a single write. Names are checked before
+        anything is sent, returns the number of tubes watched afterwards."""
+        commands = [handlers.process_watch(tube) for tube in tubes]
+        if not commands:
+            return None
+        return (await self.pipeline(commands))[-1]['count']
+
+    async def ignore_many(self, tubes):
+        """Ignore all `tubes` with a single write, see `watch_many`.
+
+        :raises BSNotIgnored: one of the tubes was the last one watched
+        """
+        commands = [handlers.process_ignore(tube) for tube in tubes]
+        if not commands:
+            return None
+        return (await self.pipeline(commands))[-1]['count']
+
+    async def sync_watched(self, tubes):
+        """Make `tubes` the watch list of the connection, only tubes that
+        are missing are watched and only extra ones ignored, with a single
+        write. Returns the number of tubes watched."""
+        tubes = list(collections.OrderedDict.fromkeys(tubes))
+        for tube in tubes:
+            check_name(tube)
+        if not tubes:
+            raise ValueError('Can not ignore every tube')
+        reply = await self.list_tubes_watched()
+        # yaml turns numeric tube names into numbers
+        current = set(str(tube) for tube in reply['data'])
+        wanted = set(tubes)
+        # watches go first, so the watch list is never emptied
+        commands = [handlers.process_watch(tube) for tube in tubes
+                    if tube not in current]
+        commands.extend(handlers.process_ignore(tube) for tube in
+                        sorted(current - wanted))
+        if not commands:
+            return len(current)
+        return (await self.pipeline(commands))[-1]['count']
+
+    async def publish_batch(self, jobs, preserve_order=False,
+                            return_exceptions=False):
+        """Put jobs into several tubes with a single write.
+
+        Jobs are grouped by tube so every group costs one ``use`` followed by
+        its ``put`` commands; jobs of one tube keep their relative order.
+        The tube used by the connection before the batch is restored
+        afterwards. Other commands must not be sent on the connection while
+        the batch is in flight.
+
+        :param jobs: ``list`` of ``(tube, data[, pri[, delay[, ttr]]])``
+        :param preserve_order: ``bool`` keep the global order of the jobs,
+            only consecutive jobs of the same tube are grouped
+        :param return_exceptions: ``bool`` if true, server errors are
+            returned in place of the reply instead of being raised
+        :return: ``list`` of put replies in the order of `jobs`
+        """
+        groups = collections.OrderedDict()
+        runs = []
+        for index, (tube, *args) in enumerate(jobs):
+            if preserve_order:
+                if not runs or runs[-1][0] != tube:
+                    runs.append((tube, []))
+                runs[-1][1].append((index, args))
+            else:
+                groups.setdefault(tube, []).append((index, args))
+        runs = runs if preserve_order else list(groups.items())
+        if not runs:
+            return []
+
+        commands = [handlers.process_list_tube_used()]
+        positions = [None] * len(jobs)
+        for tube, items in runs:
+            commands.append(handlers.process_use(tube))
+            for index, args in items:
+                positions[index] = len(commands)
+                commands.append(handlers.process_put(*args))
+        futures = self._cmd_many(commands)
+
+        # the previous tube is known after the first reply, restoring it
+        # right away overlaps with the puts still in flight
+        previous = (await futures[0])['tube']
+        if previous != runs[-1][0]:
+            futures.append(self._cmd(*handlers.process_use(previous)))
+        replies = await asyncio.gather(*futures[1:], return_exceptions=True)
+
+        results = [replies[position - 1] for position in positions]
+        if not return_exceptions:
+            for reply in replies:
+                if isinstance(reply, Exception):
+                    raise reply
+        return results
+
+    @classmethod
+    async def connect(cls, host, port, **options):
+        address = parse_address(host, port)
+        if address[0] == 'unix':
+            reader, writer = await asyncio.open_unix_connection(address[1])
         else:
-            reply = handler(status_raw.decode())
-        return reply
+            reader, writer = await asyncio.open_connection(
+                address[1], address[2])
+        tune_socket(writer.get_extra_info('socket'), **options)
+        return cls(reader, writer)
 
+    async def _read_replies(self):
+        try:
+            while self._conn.pending:
+                data = await self.reader.read(2**16)
+                if not data:
+                    raise ConnectionResetError(
+                        'Connection closed by the server')
+                for reply in self._conn.receive_data(data):
+                    if self.recorder is not None:
+                        self.recorder.reply(reply.raw)
+                    fut = reply.token
+                    # the caller is not waiting any more
+                    if fut.done():
+                        continue
+                    if reply.error is not None:
+                        fut.set_exception(reply.error)
+                    else:
+                        fut.set_result(reply.result)
+        except asyncio.CancelledError:
+            self._fail(ConnectionError('Connection is closed'))
+            raise
+        except Exception as exc:
+            # the stream is broken, no further reply can be matched
+            self._fail(exc)
+        finally:
+            self._reader_task = None
@@ -0,0 +1,224 @@
+"""
+Wire traffic capture and replay.
+
+A `Recorder` attached to a connection logs every write and every reply with
+a timestamp into a compact binary file. The log can be replayed through the
+client against a real server or against a `ReplayServer` that answers with
+the recorded replies, at the original or an accelerated pace, to compare
+latency and throughput of client versions::
+
+    recorder = Recorder('traffic.bscap')
+    recorder.attach(bs)
+    ...
+    recorder.close()
+
+    python -m aiobeanstalk.capture traffic.bscap --stand-in --speed 0
+
+Log format: ``BSCAP1\\n`` followed by entries of ``kind`` (uint8, 0 for
+commands, 1 for replies), ``time`` (float64, seconds since the start of the
+capture) and ``length`` (uint32), big endian, each followed by the payload.
+"""
+import argparse
+import asyncio
+import struct
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.helpers import int_it
+
+MAGIC = b'BSCAP1\n'
+COMMAND, REPLY = 0, 1
+_ENTRY = struct.Struct('>BdI')
+
+
+class Recorder:
+    """Writes the traffic of the connections it is attached to into the
+    file at `path`.
+
+    :param path: ``str`` log file, overwritten
+    :param buffering: ``int`` size of the write buffer in bytes
+    """
+
+    def __init__(self, path, buffering=2**20, clock=time.monotonic):
+        self._clock = clock
+        self._file = open(path, 'wb', buffering=buffering)
+        self._file.write(MAGIC)
+        self._start = clock()
+
+    def attach(self, bs):
+        bs.recorder = self
+        return bs
+
+    def command(self, data):
+        self._write(COMMAND, data)
+
+    def reply(self, data):
+        self._write(REPLY, data)
+
+    def _write(self, kind, data):
+        self._file.write(_ENTRY.pack(kind, self._clock() - self._start,
+                                     len(data)))
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+def read_log(path):
+    """Yield ``(kind, time, payload)`` entries of a capture log."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a capture log'.format(path))
+        while True:
+            header = f.read(_ENTRY.size)
+            if len(header) < _ENTRY.size:
+                return
+            kind, timestamp, length = _ENTRY.unpack(header)
+            yield kind, timestamp, f.read(length)
+
+
+def split_commands(data):
+    """Split one recorded write into single commands."""
+    commands = []
+    while data:
+        line, sep, rest = data.partition(b'\r\n')
+        end = len(line) + len(sep)
+        if line.startswith(b'put '):
+            end += int(line.split()[-1]) + 2
+        commands.append(data[:end])
+        data = data[end:]
+    return commands
+
+
+def command_handler(raw):
+    """Build the ``(command, handler)`` pair of a raw recorded command."""
+    line, _, rest = raw.partition(b'\r\n')
+    name, *args = line.decode().split()
+    if name == 'put':
+        pri, delay, ttr, size = map(int, args)
+        return handlers.process_put(rest[:size].decode(), pri, delay, ttr)
+    func = getattr(handlers, 'process_{}'.format(name.replace('-', '_')))
+    return func(*map(int_it, args))
+
+
+class ReplayServer:
+    """Stand-in server that answers every command with the next recorded
+    reply, whatever the command is.
+
+    :param records: capture log entries, see `read_log`
+    """
+
+    def __init__(self, records):
+        self.replies = [data for kind, _, data in records if kind == REPLY]
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        index = 0
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b'put '):
+                    await reader.readexactly(int(line.split()[-1]) + 2)
+                if self.replies:
+                    writer.write(self.replies[index % len(self.replies)])
+                    index += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latency percentiles and throughput of a replay."""
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+
+    return {
+        'commands': len(latencies),
+        'errors': errors,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else None,
+        'p50': percentile(0.5),
+        'p99': percentile(0.99),
+        'max': latencies[-1] if latencies else None,
+    }
+
+
+async def replay(bs, records, speed=1.0):
+    """Send the recorded commands through connection `bs`.
+
+    :param records: capture log entries, see `read_log`
+    :param speed: ``float`` pace relative to the capture, 2 is twice as
+        fast, 0 sends everything as fast as possible
+    :return: ``dict`` see `summarize`
+    """
+    loop = asyncio.get_running_loop()
+    commands = [(timestamp, raw) for kind, timestamp, data in records
+                if kind == COMMAND for raw in split_commands(data)]
+    latencies, futures = [], []
+    start = loop.time()
+    for timestamp, raw in commands:
+        if speed:
+            delay = start + timestamp / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        sent = loop.time()
+        fut = bs._cmd(*command_handler(raw))
+        fut.add_done_callback(
+            lambda _, sent=sent: latencies.append(loop.time() - sent))
+        futures.append(fut)
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    errors = sum(1 for result in results if isinstance(result, Exception))
+    return summarize(latencies, loop.time() - start, errors)
+
+
+ARGS = argparse.ArgumentParser(description="Replay captured traffic.")
+ARGS.add_argument('log', help='capture log file')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+ARGS.add_argument('--speed', type=float, default=1.0,
+                  help='pace relative to the capture, 0 for no pauses')
+ARGS.add_argument('--stand-in', action='store_true',
+                  help='replay against a local server answering with the '
+                       'recorded replies')
+
+
+def main(argv=None):
+    args = ARGS.parse_args(argv)
+    records = list(read_log(args.log))
+
+    async def run():
+        server = None
+        host, port = args.host, args.port
+        if args.stand_in:
+            server = ReplayServer(records)
+            host, port = await server.start()
+        try:
+            async with connect(host, port) as bs:
+                return await replay(bs, records, args.speed)
+        finally:
+            if server is not None:
+                await server.close()
+
+    for key, value in sorted(asyncio.run(run()).items()):
+        print('{:<12}{}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
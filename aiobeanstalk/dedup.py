@@ -0,0 +1,230 @@
+"""
+Producer-side deduplication with idempotency keys.
+
+beanstalkd has no idempotency concept, so a producer retrying a ``put`` whose
+outcome is unknown creates a duplicate job. `DedupProducer` remembers the keys
+of jobs put within a window and skips puts of keys it has already seen;
+concurrent puts of the same key are collapsed into one ``put``::
+
+    producer = DedupProducer(bs, Deduplicator(ttl=600))
+    await producer.put('{"order": 42}', dedup_key='order-42')
+
+The key travels in the envelope header, so consumers can drop jobs delivered
+twice with their own `Deduplicator`::
+
+    key = job_key(job)
+    if key is not None and not dedup.first_seen(key):
+        await bs.delete(job['jid'])
+
+Keys are kept in a bounded LRU with a TTL. For key spaces too large for the
+LRU an optional pair of rotating Bloom filters keeps remembering keys after
+they are evicted, at the price of a small rate of false positives, i.e. new
+jobs taken for duplicates.
+"""
+import asyncio
+import collections
+import hashlib
+import math
+import time
+
+from aiobeanstalk import envelope
+
+DEDUP_HEADER = 'dedup'
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire `ttl` seconds after they
+    were set."""
+
+    def __init__(self, maxsize=100000, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return default
+        if expires <= self._clock():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        now = self._clock()
+        self._data[key] = now + self.ttl, value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, key):
+        self._data.pop(key, None)
+
+
+class BloomFilter:
+    """Fixed size Bloom filter of string keys.
+
+    :param capacity: ``int`` number of keys the filter is sized for
+    :param error_rate: ``float`` false positive rate at `capacity` keys
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        size = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(int(math.ceil(size)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(key))
+
+    def clear(self):
+        self._bits = bytearray(len(self._bits))
+        self.count = 0
+
+
+class Deduplicator:
+    """Remembers idempotency keys for `ttl` seconds.
+
+    :param maxsize: ``int`` number of keys kept in the LRU
+    :param ttl: ``float`` seconds a key is remembered
+    :param bloom_capacity: ``int`` number of keys per `ttl` window the Bloom
+        filters are sized for, no Bloom filters if ``None``
+    :param bloom_error_rate: ``float`` false positive rate of the filters
+    :param clock: callable returning monotonic time in seconds
+    """
+
+    def __init__(self, maxsize=100000, ttl=300, bloom_capacity=None,
+                 bloom_error_rate=0.001, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._cache = TTLCache(maxsize, ttl, clock)
+        self._blooms = None
+        if bloom_capacity is not None:
+            # the current filter takes new keys and the previous one still
+            # answers for the last window, so a key is remembered between
+            # one and two windows
+            self._blooms = [BloomFilter(bloom_capacity, bloom_error_rate),
+                            BloomFilter(bloom_capacity, bloom_error_rate)]
+            self._rotated = clock()
+
+    def _rotate(self):
+        now = self._clock()
+        if now - self._rotated < self.ttl:
+            return
+        previous, current = self._blooms
+        previous.clear()
+        if now - self._rotated >= 2 * self.ttl:
+            current.clear()
+        self._blooms = [current, previous]
+        self._rotated = now
+
+    def get(self, key):
+        """Return the value stored with `key`, ``True`` if only the Bloom
+        filters know it, or ``None`` if it was not seen."""
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        if self._blooms is not None:
+            self._rotate()
+            if any(key in bloom for bloom in self._blooms):
+                return True
+        return None
+
+    def seen(self, key):
+        return self.get(key) is not None
+
+    def mark_seen(self, key, value=True):
+        """Remember `key`, optionally with a value such as the job id."""
+        self._cache.set(key, value)
+        if self._blooms is not None:
+            self._rotate()
+            self._blooms[1].add(key)
+
+    def first_seen(self, key):
+        """Mark `key` as seen and return ``True`` if it was not seen
+        before."""
+        if self.seen(key):
+            return False
+        self.mark_seen(key)
+        return True
+
+    def forget(self, key):
+        """Drop `key` from the LRU, the Bloom filters can not forget."""
+        self._cache.discard(key)
+
+
+def job_key(job):
+    """Return the idempotency key of a reserved `job` or ``None``."""
+    meta, _ = envelope.unpack(job.get('data') or '')
+    return meta.get(DEDUP_HEADER)
+
+
+class DedupProducer:
+    """Puts jobs through connection `bs` at most once per idempotency key
+    within the window of `dedup`, any other command is passed to the
+    connection as is.
+
+    :param bs: ``Beanstalk`` connection
+    :param dedup: ``Deduplicator`` instance, default one if omitted
+    :param header: ``bool`` stamp the key into the envelope header
+    """
+
+    def __init__(self, bs, dedup=None, header=True):
+        self._bs = bs
+        self.dedup = dedup or Deduplicator()
+        self.header = header
+        # dedup key -> task of the put in flight
+        self._inflight = {}
+
+    def __getattr__(self, attr):
+        return getattr(self._bs, attr)
+
+    async def put(self, data, pri=1, delay=0, ttr=60, dedup_key=None):
+        """Put a job unless a job with `dedup_key` was already put. A
+        skipped put returns ``{'state': 'duplicate', 'jid': ...}``, the
+        ``jid`` is ``None`` when it is not known any more."""
+        if dedup_key is None:
+            return await self._bs.put(data, pri, delay, ttr)
+        task = self._inflight.get(dedup_key)
+        if task is not None:
+            reply = await asyncio.shield(task)
+            return {'state': 'duplicate', 'jid': reply['jid']}
+        jid = self.dedup.get(dedup_key)
+        if jid is not None:
+            return {'state': 'duplicate',
+                    'jid': None if jid is True else jid}
+        if self.header:
+            data = envelope.pack(data, **{DEDUP_HEADER: dedup_key})
+        task = asyncio.ensure_future(self._bs.put(data, pri, delay, ttr))
+        self._inflight[dedup_key] = task
+        try:
+            reply = await asyncio.shield(task)
+        finally:
+            self._inflight.pop(dedup_key, None)
+        # a failed put raised above and leaves the key unseen, so the
+        # caller can retry it
+        self.dedup.mark_seen(dedup_key, reply['jid'])
+        return reply
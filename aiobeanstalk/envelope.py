@@ -0,0 +1,35 @@
+"""
+Optional metadata header carried in front of a job body.
+
+beanstalkd never looks into job bodies, so producers and consumers that agree
+on it can pass metadata (priority, ttr, ...) in a single header line::
+
+    !bs {"pri":10}\n<body>
+
+Bodies without the header are returned untouched with empty metadata.
+"""
+import json
+
+HEADER_PREFIX = '!bs '
+
+
+def pack(data, **meta):
+    """Prepend a header with `meta` to the job body `data`."""
+    if not meta:
+        return data
+    header = json.dumps(meta, separators=(',', ':'), sort_keys=True)
+    return '{}{}\n{}'.format(HEADER_PREFIX, header, data)
+
+
+def unpack(data):
+    """Split job body `data` into ``(meta, body)``."""
+    if not data.startswith(HEADER_PREFIX):
+        return {}, data
+    header, sep, body = data.partition('\n')
+    try:
+        meta = json.loads(header[len(HEADER_PREFIX):])
+    except ValueError:
+        return {}, data
+    if not sep or not isinstance(meta, dict):
+        return {}, data
+    return meta, body
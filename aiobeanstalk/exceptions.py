@@ -28,6 +28,11 @@ class BadFormatJobTooBig(AioBeanstalkException):
     """
 
 
+class RpcError(AioBeanstalkException):
+    """Remote handler of an RPC call failed, or there is no handler
+    registered for the method."""
+
+
 
 class BeanstalkException(AioBeanstalkException):
     """Base class for Beanstalk exception errors."""
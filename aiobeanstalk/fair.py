@@ -0,0 +1,192 @@
+"""
+Weighted fair consumption across tubes.
+
+``reserve`` hands out jobs from the watched tubes in server order, so a busy
+tube can starve the others. `FairConsumer` keeps one connection per tube and
+chooses the tube of every reservation by smooth weighted round robin, so over
+any window each tube with ready jobs gets a share of the reservations
+proportional to its weight::
+
+    consumer = FairConsumer({'interactive': 5, 'bulk': 1})
+    await consumer.start()
+    while True:
+        job = await consumer.reserve()
+        ...
+        await consumer.delete(job)
+
+Tubes found empty are skipped for a short while, and so are tubes a
+``StatsMonitor`` reports without ready jobs. When no tube is known to have
+ready jobs, a blocking ``reserve-with-timeout`` is sent on every connection
+and the jobs that come back are handed out by weight.
+"""
+import asyncio
+import collections
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.exceptions import BSTimedOut, BSDeadlineSoon
+
+
+class _Lane:
+    """Connection and scheduling state of one tube."""
+
+    def __init__(self, tube, weight):
+        self.tube = tube
+        self.weight = weight
+        self.bs = None
+        self.current = 0
+        # jobs reserved by blocking reserves, not handed out yet
+        self.jobs = collections.deque()
+        self.waiting = None
+        self.empty_until = 0
+
+
+def pick(lanes):
+    """Choose one of `lanes` by smooth weighted round robin."""
+    total = 0
+    best = None
+    for lane in lanes:
+        lane.current += lane.weight
+        total += lane.weight
+        if best is None or lane.current > best.current:
+            best = lane
+    best.current -= total
+    return best
+
+
+class FairConsumer:
+    """Reserves jobs from `tubes` in proportion to their weights.
+
+    Jobs must be acknowledged through the consumer, they belong to the
+    connection of their tube. While no tube has ready jobs every connection
+    is blocked in a reserve for up to `reserve_timeout` seconds, and
+    acknowledgements of that tube wait for it, so keep it short.
+
+    :param tubes: ``dict`` of tube name to ``int`` weight
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param reserve_timeout: ``int`` seconds a blocking reserve waits
+    :param empty_backoff: ``float`` seconds a tube found empty is skipped
+    :param monitor: ``StatsMonitor`` whose ``current-jobs-ready`` counts
+        are used to skip empty tubes
+    :param options: socket options passed to `connect`
+    """
+
+    def __init__(self, tubes, host='localhost', port=11300, reserve_timeout=1,
+                 empty_backoff=0.1, monitor=None, **options):
+        self._lanes = collections.OrderedDict()
+        for tube, weight in dict(tubes).items():
+            if weight < 1:
+                raise ValueError('Weight of {} must be at least 1'
+                                 .format(tube))
+            self._lanes[tube] = _Lane(tube, weight)
+        if not self._lanes:
+            raise ValueError('No tubes to consume')
+        self.host, self.port = host, port
+        self.reserve_timeout = reserve_timeout
+        self.empty_backoff = empty_backoff
+        self.monitor = monitor
+        self._options = options
+
+    async def _connect(self, tube):
+        bs = await connect(self.host, self.port, **self._options)
+        commands = [handlers.process_watch(tube)]
+        if tube != 'default':
+            commands.append(handlers.process_ignore('default'))
+        await bs.pipeline(commands)
+        return bs
+
+    async def start(self):
+        connections = await asyncio.gather(
+            *[self._connect(tube) for tube in self._lanes])
+        for lane, bs in zip(self._lanes.values(), connections):
+            lane.bs = bs
+
+    async def close(self):
+        """Release jobs that were reserved but not handed out and close
+        the connections."""
+        for lane in self._lanes.values():
+            if lane.waiting is not None:
+                lane.waiting.cancel()
+        for lane in self._lanes.values():
+            if lane.bs is None:
+                continue
+            jobs, lane.jobs = list(lane.jobs), collections.deque()
+            await lane.bs.pipeline(
+                [handlers.process_release(job['jid']) for job in jobs],
+                return_exceptions=True)
+            await lane.bs.close()
+            lane.bs = None
+
+    def _skip(self, lane, now):
+        if lane.empty_until > now:
+            return True
+        if self.monitor is not None and self.monitor.fresh:
+            stats = self.monitor.tubes.get(lane.tube)
+            return stats is None or not stats.get('current-jobs-ready')
+        return False
+
+    def _job(self, lane, job):
+        job['tube'] = lane.tube
+        return job
+
+    async def reserve(self, timeout=None):
+        """Reserve the next job, its ``tube`` key names the tube it came
+        from. Raises ``BSTimedOut`` if there is no job within `timeout`
+        seconds."""
+        end = None if timeout is None else time.monotonic() + timeout
+        lanes = list(self._lanes.values())
+        while True:
+            now = time.monotonic()
+            candidates = [lane for lane in lanes if lane.jobs or (
+                lane.waiting is None and not self._skip(lane, now))]
+            if candidates:
+                lane = pick(candidates)
+                if lane.jobs:
+                    return lane.jobs.popleft()
+                try:
+                    job = await lane.bs.reserve_with_timeout(0)
+                except (BSTimedOut, BSDeadlineSoon):
+                    lane.empty_until = now + self.empty_backoff
+                    continue
+                return self._job(lane, job)
+
+            remaining = None if end is None else end - now
+            if remaining is not None and remaining <= 0:
+                raise BSTimedOut()
+            for lane in lanes:
+                if lane.waiting is None:
+                    lane.waiting = asyncio.create_task(self._wait(lane))
+            done, _ = await asyncio.wait(
+                [lane.waiting for lane in lanes if lane.waiting is not None],
+                timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
+
+    async def _wait(self, lane):
+        try:
+            job = await lane.bs.reserve_with_timeout(
+                self.reserve_timeout)
+            lane.jobs.append(self._job(lane, job))
+        except (BSTimedOut, BSDeadlineSoon):
+            pass
+        finally:
+            lane.waiting = None
+
+    def connection(self, job):
+        """Connection the reserved `job` belongs to."""
+        return self._lanes[job['tube']].bs
+
+    def delete(self, job):
+        return self.connection(job).delete(job['jid'])
+
+    def release(self, job, pri=1, delay=0):
+        return self.connection(job).release(job['jid'], pri, delay)
+
+    def bury(self, job, pri=1):
+        return self.connection(job).bury(job['jid'], pri)
+
+    def touch(self, job):
+        return self.connection(job).touch(job['jid'])
@@ -218,6 +218,15 @@ def process_kick(bound=10):
     return 'kick {}\r\n'.format(bound)
 
 
+@_interaction(OK('KICKED'))
+def process_kick_job(jid):
+    """The kick-job command is a variant of kick that operates with a single
+    job identified by its job id. If the given job id exists and is in a
+    buried or delayed state, it will be moved to the ready queue of the same
+    tube where it currently belongs."""
+    return 'kick-job {}\r\n'.format(jid)
+
+
 @_interaction(OK('TOUCHED'))
 def process_touch(jid):
     """The "touch" command allows a worker to request more time to work on a job.
@@ -311,3 +320,16 @@ def process_list_tubes_watched():
        is a YAML file containing watched tube names as a list of strings.
     """
     return 'list-tubes-watched\r\n'
+
+
+@_interaction(OK('PAUSED'))
+def process_pause_tube(tube, delay):
+    """The pause-tube command can delay any new job being reserved for a given
+    time.
+
+    :param tube: ``str`` is the tube to pause
+    :param delay: ``int`` is an integer number of seconds to wait before
+        reserving any more jobs from the queue, 0 resumes the tube
+    """
+    check_name(tube)
+    return 'pause-tube {} {}\r\n'.format(tube, delay)
@@ -1,11 +1,17 @@
-import io
 import re
+import socket
+import urllib.parse
+
 import yaml
 from aiobeanstalk.exceptions import _BS_ERRORS, BadFormatException
 
 # default value on server
 MAX_JOB_SIZE = (2**16) - 1
 
+# libyaml based loader is much faster, stats replies are plain mappings so the
+# safe loader is enough
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 def check_error(error_name):
     """Note, this will throw an error internally for every case that is a
@@ -42,5 +48,38 @@ def yaml_parser(yaml_string):
     :param yaml_string:
     :return:
     """
-    handler = io.StringIO(yaml_string)
-    return yaml.load(handler)
+    return yaml.load(yaml_string, Loader=_YamlLoader)
+
+
+def parse_address(host='localhost', port=11300):
+    """Resolve `host` into the address to connect to. Besides a host name it
+    may be a url (``beanstalk://host:port``, ``unix:///path/to.sock``) or
+    the path of a unix socket.
+
+    :return: ``tuple`` ``('unix', path)`` or ``('tcp', host, port)``
+    """
+    if host.startswith('/'):
+        return 'unix', host
+    if '://' not in host:
+        return 'tcp', host, port
+    url = urllib.parse.urlsplit(host)
+    if url.scheme == 'unix':
+        return 'unix', url.netloc + url.path
+    if url.scheme in ('beanstalk', 'beanstalkd', 'tcp'):
+        return 'tcp', url.hostname or 'localhost', url.port or port
+    raise ValueError('Unsupported url scheme: {}'.format(url.scheme))
+
+
+def tune_socket(sock, nodelay=True, keepalive=False, sndbuf=None,
+                rcvbuf=None):
+    """Apply socket options to the transport socket `sock`."""
+    if sock is None:
+        return
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        # small pipelined commands must not wait for Nagle's algorithm
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(nodelay))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, int(keepalive))
+    if sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
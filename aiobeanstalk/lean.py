@@ -0,0 +1,128 @@
+"""
+Low-footprint connections for processes holding thousands of sockets.
+
+`LeanBeanstalk` is an ``asyncio.Protocol`` instead of a ``StreamReader`` and
+``StreamWriter`` pair: the bytes handed to ``data_received`` go straight to
+the ``aiobeanstalk.protocol`` parser and the replies resolve plain futures,
+so there is no stream buffer to copy through and no task per command. The
+parser only allocates its buffers while replies are outstanding, an idle
+connection is the transport plus two objects with a handful of slots::
+
+    bs = await lean_connect('localhost', 11300)
+    await bs.watch('tenant-42')
+    job = await bs.reserve()
+
+Commands are the same as on ``Beanstalk``: ``bs.put(...)``, ``bs.pipeline``
+and so on, each returns a future.
+"""
+import asyncio
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import Beanstalk
+from aiobeanstalk.helpers import parse_address, tune_socket
+from aiobeanstalk.protocol import Connection
+
+
+class LeanBeanstalk(asyncio.Protocol):
+    """Beanstalk connection implemented as a protocol."""
+
+    __slots__ = ('_transport', '_conn', '_exc')
+
+    def __init__(self):
+        self._transport = None
+        self._conn = Connection()
+        self._exc = None
+
+    def __getattr__(self, attr):
+        # slots that are not set and special names are not commands
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+
+        def caller(*args, **kw):
+            h = getattr(handlers, 'process_{}'.format(attr))
+            return self._cmd(*h(*args, **kw))
+        return caller
+
+    @property
+    def transport(self):
+        return self._transport
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def connection_lost(self, exc):
+        self._fail(exc or ConnectionResetError('Connection lost'))
+
+    def _fail(self, exc):
+        self._exc = exc
+        self._transport = None
+        for fut in self._conn.clear():
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Close the connection, the transport flushes pending writes in
+        the background. Commands still waiting for their reply fail with
+        ``ConnectionError``."""
+        transport = self._transport
+        if transport is not None:
+            self._fail(ConnectionError('Connection is closed'))
+            transport.close()
+
+    def _cmd(self, command, handler=None):
+        return self._cmd_many([(command, handler)])[0]
+
+    def _cmd_many(self, commands):
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in commands]
+        if self._transport is None:
+            exc = self._exc or ConnectionError('Not connected')
+            for fut in futures:
+                fut.set_exception(exc)
+            return futures
+        self._transport.write(self._conn.send(commands, futures))
+        return futures
+
+    async def pipeline(self, commands, return_exceptions=False):
+        """Send several commands with a single write and wait for all
+        replies, see ``Beanstalk.pipeline``."""
+        if not commands:
+            return []
+        return await asyncio.gather(*self._cmd_many(commands),
+                                    return_exceptions=return_exceptions)
+
+    # they only need `pipeline`
+    watch_many = Beanstalk.watch_many
+    ignore_many = Beanstalk.ignore_many
+    sync_watched = Beanstalk.sync_watched
+
+    def data_received(self, data):
+        for reply in self._conn.receive_data(data):
+            fut = reply.token
+            if fut.done():
+                continue
+            if reply.error is not None:
+                fut.set_exception(reply.error)
+            else:
+                fut.set_result(reply.result)
+
+
+async def lean_connect(host='localhost', port=11300, **options):
+    """Connect to beanstalk server and return a `LeanBeanstalk`, arguments
+    are the same as for ``connect``."""
+    loop = asyncio.get_running_loop()
+    address = parse_address(host, port)
+    if address[0] == 'unix':
+        transport, protocol = await loop.create_unix_connection(
+            LeanBeanstalk, address[1])
+    else:
+        transport, protocol = await loop.create_connection(
+            LeanBeanstalk, address[1], address[2])
+    tune_socket(transport.get_extra_info('socket'), **options)
+    return protocol
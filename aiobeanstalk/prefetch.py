@@ -0,0 +1,167 @@
+"""
+Bounded buffer of prefetched jobs ordered by priority.
+
+beanstalkd hands out the most urgent job at the time of the ``reserve``, but
+once several jobs are prefetched they would be processed in arrival order.
+`PrefetchBuffer` keeps reserved jobs in a heap ordered by priority, so an
+urgent job reserved later is still processed first, and releases jobs whose
+TTR would expire before they could be processed.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+
+from aiobeanstalk import handlers, envelope
+from aiobeanstalk.exceptions import BSTimedOut, BSDeadlineSoon, BSOutOfMemory
+from aiobeanstalk.log import logger
+
+PRIORITY_HEADER = 'header'
+PRIORITY_STATS = 'stats'
+
+
+class PrefetchBuffer:
+    """Reserves up to `maxsize` jobs ahead on connection `bs`.
+
+    All buffered jobs are reserved by `bs`, so they must be deleted,
+    released or buried through the same connection.
+
+    :param bs: ``Beanstalk`` connection watching the tubes to consume
+    :param maxsize: ``int`` number of jobs to hold at most
+    :param priority: ``str`` where job priorities come from: ``'header'``
+        reads ``pri`` and ``ttr`` from the envelope header (no extra round
+        trip), ``'stats'`` asks ``stats-job`` for every job
+    :param default_pri: ``int`` priority of jobs without a header
+    :param default_ttr: ``int`` TTR assumed for jobs without a header
+    :param min_time_left: ``float`` jobs with less seconds of TTR left are
+        released instead of handed out
+    :param reserve_timeout: ``int`` seconds to wait for a job when the buffer
+        is empty
+    :param on_overload: callable invoked on ``DEADLINE_SOON`` or
+        ``OUT_OF_MEMORY`` replies
+    """
+
+    def __init__(self, bs, maxsize=16, priority=PRIORITY_HEADER,
+                 default_pri=2**31, default_ttr=60, min_time_left=1.0,
+                 reserve_timeout=1, on_overload=None):
+        if priority not in (PRIORITY_HEADER, PRIORITY_STATS):
+            raise ValueError('Unknown priority source: {}'.format(priority))
+        self.bs = bs
+        self.maxsize = maxsize
+        self.priority = priority
+        self.default_pri = default_pri
+        self.default_ttr = default_ttr
+        self.min_time_left = min_time_left
+        self.reserve_timeout = reserve_timeout
+        self.on_overload = on_overload
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._not_empty = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self):
+        """Start prefetching jobs in the background."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._fill())
+        return self._task
+
+    async def close(self):
+        """Stop prefetching and release every buffered job."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        jobs = [job for _, _, job in self._heap]
+        self._heap = []
+        self._not_empty.clear()
+        await self._release(jobs)
+
+    async def get(self, timeout=None):
+        """Return the most urgent buffered job. Raises ``BSTimedOut`` if no
+        job arrives within `timeout` seconds."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            await self._release_expired()
+            if self._heap:
+                _, _, job = heapq.heappop(self._heap)
+                if not self._heap:
+                    self._not_empty.clear()
+                self._changed.set()
+                return job
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise BSTimedOut()
+            try:
+                await asyncio.wait_for(self._not_empty.wait(), remaining)
+            except asyncio.TimeoutError:
+                raise BSTimedOut()
+
+    def push(self, job, pri, deadline):
+        job['pri'], job['deadline'] = pri, deadline
+        heapq.heappush(self._heap, (pri, next(self._counter), job))
+        self._not_empty.set()
+
+    async def _release_expired(self):
+        limit = time.monotonic() + self.min_time_left
+        expired = [job for _, _, job in self._heap if job['deadline'] < limit]
+        if not expired:
+            return
+        self._heap = [item for item in self._heap
+                      if item[2]['deadline'] >= limit]
+        heapq.heapify(self._heap)
+        if not self._heap:
+            self._not_empty.clear()
+        self._changed.set()
+        logger.debug("Releasing {} jobs close to TTR".format(len(expired)))
+        await self._release(expired)
+
+    async def _release(self, jobs):
+        if not jobs:
+            return
+        commands = [handlers.process_release(job['jid'], job['pri'])
+                    for job in jobs]
+        # jobs whose TTR already expired are back in the ready queue and
+        # answer NOT_FOUND, nothing else to do about them
+        await self.bs.pipeline(commands, return_exceptions=True)
+
+    async def _fill(self):
+        while True:
+            if len(self._heap) >= self.maxsize:
+                await self._wait_changed(None)
+                continue
+            # do not hold the connection in a blocking reserve while there
+            # are buffered jobs, acks sent on it would wait behind it
+            timeout = 0 if self._heap else self.reserve_timeout
+            try:
+                job = await self.bs.reserve_with_timeout(timeout)
+            except BSTimedOut:
+                if self._heap:
+                    await self._wait_changed(self.reserve_timeout)
+                continue
+            except (BSDeadlineSoon, BSOutOfMemory) as exc:
+                logger.debug("Prefetch paused: {!r}".format(exc))
+                if self.on_overload is not None:
+                    self.on_overload()
+                await self._wait_changed(1)
+                continue
+            reserved = time.monotonic()
+            if self.priority == PRIORITY_STATS:
+                stats = (await self.bs.stats_job(job['jid']))['data']
+                pri, time_left = stats['pri'], stats['time-left']
+            else:
+                meta, job['data'] = envelope.unpack(job['data'])
+                job['meta'] = meta
+                pri = meta.get('pri', self.default_pri)
+                time_left = meta.get('ttr', self.default_ttr)
+            self.push(job, pri, reserved + time_left)
+
+    async def _wait_changed(self, timeout):
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,126 @@
+"""
+Sans-I/O beanstalk protocol.
+
+`Connection` never touches a socket: `send` turns commands into the bytes to
+write and remembers which reply each of them expects, `receive_data` takes
+whatever bytes arrived and returns a `Reply` for every reply that is now
+complete, in the order the commands were sent. The asyncio clients, the
+blocking client in ``aiobeanstalk.blocking`` or a test feeding bytes by hand
+all drive the same parser::
+
+    conn = Connection()
+    sock.sendall(conn.send([handlers.process_put('job')]))
+    replies = []
+    while not replies:
+        replies = conn.receive_data(sock.recv(65536))
+    reply, = replies
+    print(reply.result or reply.error)
+"""
+import collections
+
+from aiobeanstalk.helpers import check_error
+
+Reply = collections.namedtuple('Reply', 'token result error raw')
+Reply.__doc__ = """Outcome of one command.
+
+:param token: object passed to `Connection.send` along with the command
+:param result: ``dict`` parsed reply, ``None`` on error
+:param error: ``BeanstalkException`` the server replied with, or
+    ``UnexpectedResponse`` for a reply the command does not allow
+:param raw: ``bytes`` the reply as received
+"""
+
+
+class Connection:
+    """State of one beanstalk connection.
+
+    The receive buffer and the queue of pending commands are only allocated
+    while replies are outstanding.
+    """
+
+    __slots__ = ('_buffer', '_pending')
+
+    def __init__(self):
+        self._buffer = None
+        self._pending = None
+
+    @property
+    def pending(self):
+        """Number of commands waiting for their reply."""
+        return len(self._pending) if self._pending else 0
+
+    def send(self, commands, tokens=None):
+        """Queue `commands` and return the bytes to write for them.
+
+        :param commands: ``list`` of ``(command, handler)`` pairs as returned
+            by ``handlers.process_*`` functions
+        :param tokens: ``list`` of objects, one per command, handed back in
+            `Reply.token`, e.g. the futures waiting for the replies
+        :return: ``bytes``
+        """
+        if tokens is None:
+            tokens = [None] * len(commands)
+        elif len(tokens) != len(commands):
+            raise ValueError('Expected one token per command')
+        if self._pending is None:
+            self._pending = collections.deque()
+        self._pending.extend(
+            (handler, token) for (_, handler), token in zip(commands, tokens))
+        return ''.join(command for command, _ in commands).encode()
+
+    def receive_data(self, data):
+        """Feed bytes received from the server.
+
+        :param data: ``bytes`` as read from the socket, any size
+        :return: ``list`` of `Reply` for every reply completed by `data`
+        """
+        if self._buffer is not None:
+            self._buffer.extend(data)
+            data = self._buffer
+        replies = []
+        pos = self._parse(data, replies)
+        if pos == len(data):
+            self._buffer = None
+        elif data is self._buffer:
+            del self._buffer[:pos]
+        else:
+            # only a partial reply is copied, complete ones never are
+            self._buffer = bytearray(data[pos:])
+        return replies
+
+    def clear(self):
+        """Drop every pending command and buffered byte, e.g. once the
+        connection is lost. Returns the tokens of the dropped commands."""
+        pending, self._pending = self._pending, None
+        self._buffer = None
+        return [token for _, token in pending or ()]
+
+    def _parse(self, data, replies):
+        """Append a `Reply` for every complete reply in `data` to `replies`,
+        returns the position after the last one."""
+        pos = 0
+        pending = self._pending
+        while pending:
+            eol = data.find(b'\r\n', pos)
+            if eol < 0:
+                break
+            handler, token = pending[0]
+            words = data[pos:eol].split()
+            status = words[0].decode() if words else ''
+            end = eol + 2
+            response = handler.lookup.get(status)
+            if response is not None and response.has_data:
+                # the body is followed by crlf
+                end += int(words[-1]) + 2
+                if end > len(data):
+                    break
+            pending.popleft()
+            raw, pos = bytes(data[pos:end]), end
+            try:
+                check_error(status)
+                replies.append(Reply(token, handler(raw.decode()), None, raw))
+            except Exception as exc:
+                replies.append(Reply(token, None, exc, raw))
+        if not pending:
+            self._pending = None
+        return pos
@@ -0,0 +1,185 @@
+"""
+Retry policy for failed jobs.
+
+A failed job is released back with an exponentially growing delay and an
+escalating priority until it runs out of attempts, then it is buried. Attempt
+counts are kept in a bounded local cache, so ``stats-job`` is asked only for
+jobs we have not seen fail before, and all release/bury commands issued
+during one loop iteration are sent to the server with a single write.
+"""
+import asyncio
+import collections
+
+from aiobeanstalk import handlers
+from aiobeanstalk.log import logger
+
+# beanstalkd priorities are unsigned 32 bit integers, 0 is the most urgent
+MAX_PRIORITY = 2**32 - 1
+
+
+class RetryPolicy:
+    """Describes how a failed job is retried.
+
+    :param max_attempts: ``int`` number of reserves after which the job is
+        buried instead of released
+    :param base_delay: ``int`` delay in seconds before the second attempt
+    :param factor: ``int`` multiplier applied to the delay on every attempt
+    :param max_delay: ``int`` upper bound of the delay in seconds
+    :param pri_step: ``int`` the job priority is made this much more urgent
+        on every attempt
+    :param bury_pri: ``int`` priority for buried jobs, by default the
+        priority of the last release is used
+    """
+
+    def __init__(self, max_attempts=5, base_delay=1, factor=2, max_delay=3600,
+                 pri_step=0, bury_pri=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.factor = factor
+        self.max_delay = max_delay
+        self.pri_step = pri_step
+        self.bury_pri = bury_pri
+
+    def exhausted(self, attempts):
+        return attempts >= self.max_attempts
+
+    def delay(self, attempts):
+        """Delay before the next attempt, `attempts` is the number of times
+        the job has been reserved so far."""
+        delay = self.base_delay * self.factor ** max(attempts - 1, 0)
+        return int(min(delay, self.max_delay))
+
+    def priority(self, pri, attempts):
+        """Priority of the job for the next attempt."""
+        pri = pri - self.pri_step * attempts
+        return min(max(pri, 0), MAX_PRIORITY)
+
+
+class AttemptCache:
+    """Bounded LRU mapping of job id to the number of attempts seen."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+
+    def __contains__(self, jid):
+        return jid in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, jid, default=None):
+        try:
+            self._data.move_to_end(jid)
+        except KeyError:
+            return default
+        return self._data[jid]
+
+    def set(self, jid, attempts):
+        self._data[jid] = attempts
+        self._data.move_to_end(jid)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, jid):
+        self._data.pop(jid, None)
+
+
+class Retrier:
+    """Applies `policy` to jobs that failed on connection `bs`.
+
+    Jobs can only be released or buried by the connection that reserved
+    them, so one retrier is bound to one connection.
+
+    :param bs: ``Beanstalk`` connection the jobs were reserved on
+    :param policy: ``RetryPolicy`` instance, default policy if omitted
+    :param cache_size: ``int`` number of job ids to remember attempts for
+    """
+
+    def __init__(self, bs, policy=None, cache_size=1024):
+        self._bs = bs
+        self.policy = policy or RetryPolicy()
+        self.attempts = AttemptCache(cache_size)
+        self._pending = []
+        self._flush_handle = None
+
+    def fail(self, job, pri=None):
+        """Schedule a retry of the reserved `job`. Returns a future with the
+        server reply of the release or bury command, extended with the
+        number of ``attempts`` and the ``delay`` applied.
+
+        :param job: ``dict`` as returned by ``reserve``
+        :param pri: ``int`` current priority of the job, looked up with
+            ``stats-job`` when unknown
+        """
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((job['jid'], pri, fut))
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self._schedule_flush)
+        return fut
+
+    def succeeded(self, job):
+        """Forget the attempts of a job that was processed."""
+        self.attempts.discard(job['jid'])
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, []
+        asyncio.create_task(self._flush(pending))
+
+    async def _flush(self, pending):
+        try:
+            await self._retry(pending)
+        except Exception as exc:
+            logger.exception("Failed to retry {} jobs".format(len(pending)))
+            for _, _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(exc)
+
+    async def _retry(self, pending):
+        # ask the server only about jobs we know nothing about
+        unknown = [jid for jid, pri, _ in pending
+                   if pri is None or jid not in self.attempts]
+        stats = {}
+        if unknown:
+            commands = [handlers.process_stats_job(jid) for jid in unknown]
+            replies = await self._bs.pipeline(
+                commands, return_exceptions=True)
+            stats = dict(zip(unknown, replies))
+
+        commands, actions = [], []
+        for jid, pri, fut in pending:
+            job_stats = stats.get(jid)
+            if isinstance(job_stats, Exception):
+                fut.set_exception(job_stats)
+                continue
+            job_stats = job_stats['data'] if job_stats else {}
+
+            attempts = self.attempts.get(jid)
+            attempts = (attempts + 1 if attempts is not None
+                        else job_stats.get('reserves', 1))
+            if pri is None:
+                pri = job_stats.get('pri', 0)
+            pri = self.policy.priority(pri, attempts)
+
+            if self.policy.exhausted(attempts):
+                self.attempts.discard(jid)
+                if self.policy.bury_pri is not None:
+                    pri = self.policy.bury_pri
+                delay = None
+                commands.append(handlers.process_bury(jid, pri))
+            else:
+                self.attempts.set(jid, attempts)
+                delay = self.policy.delay(attempts)
+                commands.append(handlers.process_release(jid, pri, delay))
+            actions.append((fut, attempts, delay))
+
+        replies = await self._bs.pipeline(
+            commands, return_exceptions=True)
+        for (fut, attempts, delay), reply in zip(actions, replies):
+            if isinstance(reply, Exception):
+                fut.set_exception(reply)
+            else:
+                reply.update(attempts=attempts, delay=delay)
+                fut.set_result(reply)
@@ -0,0 +1,220 @@
+"""
+Request/reply over beanstalk.
+
+Every `RpcClient` owns one reply tube that carries the responses of all its
+calls; responses are matched to waiting callers by a correlation id kept in
+the envelope header, so any number of concurrent calls share one reserve
+loop::
+
+    server = RpcServer('math')
+
+    @server.handler()
+    def double(data):
+        return str(int(data) * 2)
+
+    client = RpcClient()
+    await client.start()
+    result = await client.call('math', 'double', '21', timeout=5)
+"""
+import asyncio
+import itertools
+import os
+import time
+import uuid
+
+from aiobeanstalk import handlers, envelope
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.exceptions import RpcError
+from aiobeanstalk.log import logger
+
+
+class _Publisher:
+    """Puts jobs into arbitrary tubes over one connection, switching the
+    used tube only when it changes."""
+
+    def __init__(self, bs):
+        self.bs = bs
+        self._used = 'default'
+
+    def put(self, tube, data, pri=1, delay=0, ttr=60):
+        commands = []
+        if tube != self._used:
+            commands.append(handlers.process_use(tube))
+            self._used = tube
+        commands.append(handlers.process_put(data, pri, delay, ttr))
+        # use and put are written together, so concurrent puts to other
+        # tubes can not slip in between
+        return self.bs.pipeline(commands)
+
+
+async def _consumer(host, port, tube, options):
+    bs = await connect(host, port, **options)
+    commands = [handlers.process_watch(tube)]
+    if tube != 'default':
+        commands.append(handlers.process_ignore('default'))
+    await bs.pipeline(commands)
+    return bs
+
+
+class RpcClient:
+    """Calls remote handlers registered on `RpcServer`.
+
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param reply_tube: ``str`` tube the replies are sent to, unique per
+        client by default
+    :param options: socket options passed to `connect`
+    """
+
+    def __init__(self, host='localhost', port=11300, reply_tube=None,
+                 **options):
+        self.host, self.port = host, port
+        self.reply_tube = reply_tube or 'rpc.{}.{}'.format(
+            os.getpid(), uuid.uuid4().hex)
+        self._options = options
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._publisher = None
+        self._reply_bs = None
+        self._task = None
+
+    async def start(self):
+        bs = await connect(self.host, self.port, **self._options)
+        self._publisher = _Publisher(bs)
+        self._reply_bs = await _consumer(
+            self.host, self.port, self.reply_tube, self._options)
+        self._task = asyncio.create_task(self._receive())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for bs in (self._publisher and self._publisher.bs, self._reply_bs):
+            if bs is not None:
+                await bs.close()
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.cancel()
+        self._pending.clear()
+
+    async def call(self, tube, method, data='', timeout=30, pri=1, ttr=60):
+        """Call `method` served on `tube` with body `data` and return the
+        body of the reply.
+
+        :raises asyncio.TimeoutError: no reply within `timeout` seconds
+        :raises RpcError: the remote handler failed
+        """
+        cid = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[cid] = fut
+        try:
+            body = envelope.pack(data, cid=cid, method=method,
+                                 reply_to=self.reply_tube,
+                                 expires=time.time() + timeout)
+            await self._publisher.put(tube, body, pri, ttr=ttr)
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._pending.pop(cid, None)
+
+    async def _receive(self):
+        job = await self._reply_bs.reserve()
+        while True:
+            meta, body = envelope.unpack(job['data'])
+            fut = self._pending.get(meta.get('cid'))
+            # replies of calls that timed out are dropped
+            if fut is not None and not fut.done():
+                if 'error' in meta:
+                    fut.set_exception(RpcError(meta['error']))
+                else:
+                    fut.set_result(body)
+            # ack this reply and wait for the next one in a single write
+            _, job = await self._reply_bs.pipeline([
+                handlers.process_delete(job['jid']),
+                handlers.process_reserve()])
+
+
+class RpcServer:
+    """Serves calls sent to `tube`.
+
+    Requests are deleted as soon as they are reserved, a failed or lost
+    handler shows up as a timeout on the caller side.
+
+    :param tube: ``str`` tube requests are put into
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param concurrency: ``int`` number of requests handled at once
+    :param options: socket options passed to `connect`
+    """
+
+    def __init__(self, tube, host='localhost', port=11300, concurrency=16,
+                 **options):
+        self.tube = tube
+        self.host, self.port = host, port
+        self._options = options
+        self._handlers = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._publisher = None
+        self._request_bs = None
+        self._task = None
+
+    def handler(self, name=None):
+        """Decorator registering a handler for method `name`, the function
+        name is used by default. The handler gets the request body and
+        returns the reply body, coroutines are waited for."""
+        def decorator(func):
+            self._handlers[name or func.__name__] = func
+            return func
+        return decorator
+
+    async def start(self):
+        bs = await connect(self.host, self.port, **self._options)
+        self._publisher = _Publisher(bs)
+        self._request_bs = await _consumer(
+            self.host, self.port, self.tube, self._options)
+        self._task = asyncio.create_task(self._serve())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for bs in (self._publisher and self._publisher.bs, self._request_bs):
+            if bs is not None:
+                await bs.close()
+
+    async def _serve(self):
+        job = await self._request_bs.reserve()
+        while True:
+            await self._semaphore.acquire()
+            asyncio.create_task(self._dispatch(job['data']))
+            _, job = await self._request_bs.pipeline([
+                handlers.process_delete(job['jid']),
+                handlers.process_reserve()])
+
+    async def _dispatch(self, data):
+        try:
+            meta, body = envelope.unpack(data)
+            if 'reply_to' not in meta:
+                logger.warning("Dropping request without reply tube")
+                return
+            if meta.get('expires', float('inf')) < time.time():
+                return
+            reply = {'cid': meta.get('cid')}
+            func = self._handlers.get(meta.get('method'))
+            result = ''
+            if func is None:
+                reply['error'] = 'Unknown method: {}'.format(meta.get('method'))
+            else:
+                try:
+                    result = func(body)
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                except Exception as exc:
+                    logger.exception("RPC handler {} failed"
+                                     .format(meta['method']))
+                    reply['error'] = repr(exc)
+            await self._publisher.put(
+                meta['reply_to'], envelope.pack(result or '', **reply))
+        except Exception:
+            logger.exception("Failed to reply to RPC request")
+        finally:
+            self._semaphore.release()
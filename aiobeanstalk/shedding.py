@@ -0,0 +1,149 @@
+"""
+Server-side load shedding with ``pause-tube``.
+
+Consumers report the outcome and latency of every job to a `LoadShedder`,
+e.g. ``Worker(..., on_result=lambda job, latency, ok: shedder.record(latency,
+ok))``.
+When the error rate, the latency or the number of reserved jobs of the
+controlled tubes goes over a limit, the tubes are paused on the server, so
+every consumer of the fleet stops getting jobs without tearing down its
+reserve loop. Pauses double while the overload persists and go back to the
+minimum after a healthy window.
+"""
+import asyncio
+import collections
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.log import logger
+
+
+class LoadShedder:
+    """Pauses `tubes` while their consumers are overloaded.
+
+    :param bs: ``Beanstalk`` connection used to pause the tubes
+    :param tubes: ``list`` of tube names controlled together
+    :param max_error_rate: ``float`` share of failed jobs in the window
+        that counts as overload
+    :param max_latency: ``float`` mean handler latency in seconds that
+        counts as overload, not checked if ``None``
+    :param max_reserved: ``int`` number of reserved jobs of the tubes that
+        counts as overload, needs `monitor`
+    :param monitor: ``StatsMonitor`` providing ``current-jobs-reserved``
+    :param window: ``float`` seconds of samples considered
+    :param min_samples: ``int`` samples needed before rates are trusted
+    :param min_pause: ``int`` first pause in seconds
+    :param max_pause: ``int`` longest pause in seconds
+    :param interval: ``float`` seconds between two checks
+    :param clock: callable returning monotonic time in seconds
+    """
+
+    def __init__(self, bs, tubes, max_error_rate=0.5, max_latency=None,
+                 max_reserved=None, monitor=None, window=10.0, min_samples=10,
+                 min_pause=1, max_pause=300, interval=1.0,
+                 clock=time.monotonic):
+        self._bs = bs
+        self.tubes = list(tubes)
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.max_reserved = max_reserved
+        self.monitor = monitor
+        self.window = window
+        self.min_samples = min_samples
+        self.min_pause = min_pause
+        self.max_pause = max_pause
+        self.interval = interval
+        self._clock = clock
+
+        self._samples = collections.deque()
+        self.pause = 0
+        self.paused_until = 0
+        self._task = None
+
+    def record(self, latency, ok=True):
+        """Report a processed job."""
+        self._samples.append((self._clock(), latency, ok))
+
+    def _trim(self, now):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+    def overload(self, reserved=None):
+        """Return the reason the tubes are overloaded or ``None``."""
+        now = self._clock()
+        self._trim(now)
+        if (self.max_reserved is not None and reserved is not None and
+                reserved > self.max_reserved):
+            return '{} reserved jobs'.format(reserved)
+        if len(self._samples) < self.min_samples:
+            return None
+        failed = sum(1 for _, _, ok in self._samples if not ok)
+        error_rate = failed / len(self._samples)
+        if error_rate > self.max_error_rate:
+            return 'error rate {:.0%}'.format(error_rate)
+        if self.max_latency is not None:
+            latency = (sum(latency for _, latency, _ in self._samples) /
+                       len(self._samples))
+            if latency > self.max_latency:
+                return 'latency {:.3f}s'.format(latency)
+        return None
+
+    def decide(self, reserved=None):
+        """Return the number of seconds to pause the tubes for, or ``None``
+        if they should keep running."""
+        now = self._clock()
+        if now < self.paused_until:
+            return None
+        reason = self.overload(reserved)
+        if reason is None:
+            if self.pause and now - self.paused_until >= self.window:
+                self.pause = 0
+            return None
+        self.pause = (min(self.pause * 2, self.max_pause) if self.pause
+                      else self.min_pause)
+        self.paused_until = now + self.pause
+        # samples from before the pause say nothing about the next run
+        self._samples.clear()
+        logger.warning("Pausing {} for {}s: {}".format(
+            ', '.join(self.tubes), self.pause, reason))
+        return self.pause
+
+    async def pause_tubes(self, delay):
+        """Pause all tubes for `delay` seconds with one write, 0 resumes
+        them."""
+        commands = [handlers.process_pause_tube(tube, delay)
+                    for tube in self.tubes]
+        return await self._bs.pipeline(commands, return_exceptions=True)
+
+    async def resume(self):
+        self.paused_until = 0
+        await self.pause_tubes(0)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _reserved(self):
+        if self.monitor is None or self.max_reserved is None:
+            return None
+        await self.monitor.get()
+        return sum(self.monitor.tubes.get(tube, {})
+                   .get('current-jobs-reserved', 0) for tube in self.tubes)
+
+    async def _run(self):
+        while True:
+            try:
+                delay = self.decide(await self._reserved())
+                if delay:
+                    await self.pause_tubes(delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Load shedding check failed")
+            await asyncio.sleep(self.interval)
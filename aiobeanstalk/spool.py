@@ -0,0 +1,315 @@
+"""
+Local write-behind spool for producers.
+
+When the server is unreachable, draining or the number of puts in flight hits
+a limit, `SpooledProducer.put` appends the job to an on-disk `Spool` instead
+of waiting. A background flusher replays spooled jobs with pipelined puts and
+drops segments once every job in them is acknowledged. Delivery is at least
+once: a job may be put twice if the producer dies between a put and the
+checkpoint that follows it.
+
+Spool files are append-only segments of records::
+
+    crc32 pri delay ttr body-length  (5 x uint32, big endian)
+    body
+
+plus a checkpoint file holding the position of the first unacknowledged
+record.
+"""
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.exceptions import BeanstalkException, BSDraining, \
+    BSOutOfMemory, BSJobTooBig
+from aiobeanstalk.log import logger
+
+_RECORD = struct.Struct('>IIIII')
+
+SEGMENT_SUFFIX = '.seg'
+CHECKPOINT = 'checkpoint'
+
+# replies after which the server is considered unavailable for a while
+_UNAVAILABLE = (BSDraining, BSOutOfMemory, ConnectionError, OSError,
+                asyncio.IncompleteReadError)
+
+
+class Spool:
+    """Append-only job log in `directory`.
+
+    :param directory: ``str`` directory for segment files, created if missing
+    :param segment_size: ``int`` bytes after which a new segment is started
+    :param fsync: ``bool`` fsync after every append, slower but survives
+        power loss
+    """
+
+    def __init__(self, directory, segment_size=64 * 2**20, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX))
+        self._checkpoint = self._load_checkpoint()
+        if not self._segments:
+            self._segments.append(self._checkpoint[0])
+        self._file = None
+        self._open_active()
+        self.pending = sum(1 for _ in self._records(self._checkpoint, None))
+
+    def _path(self, segment):
+        return os.path.join(self.directory,
+                            '{:012d}{}'.format(segment, SEGMENT_SUFFIX))
+
+    def _load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                checkpoint = json.load(f)
+            return checkpoint['segment'], checkpoint['offset']
+        except (OSError, ValueError, KeyError):
+            return (self._segments[0] if self._segments else 0), 0
+
+    def _open_active(self):
+        path = self._path(self._segments[-1])
+        # drop a record torn by a crash in the middle of an append
+        valid = 0
+        for (_, valid), _ in self._scan(self._segments[-1], 0):
+            pass
+        with open(path, 'ab') as f:
+            f.truncate(valid)
+        self._file = open(path, 'ab')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self):
+        return self.pending
+
+    def append(self, data, pri=1, delay=0, ttr=60):
+        """Append a job to the spool."""
+        body = data.encode() if isinstance(data, str) else data
+        header = _RECORD.pack(0, pri, delay, ttr, len(body))
+        crc = zlib.crc32(header[4:] + body) & 0xffffffff
+        if self._file.tell() >= self.segment_size:
+            self._roll()
+        self._file.write(_RECORD.pack(crc, pri, delay, ttr, len(body)))
+        self._file.write(body)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.pending += 1
+
+    def _roll(self):
+        self._file.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._file = open(self._path(self._segments[-1]), 'ab')
+
+    def _scan(self, segment, offset):
+        """Yield ``((segment, end offset), record)`` of the valid records of
+        `segment` starting at `offset`."""
+        try:
+            f = open(self._path(segment), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= offset:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as buf:
+                while offset + _RECORD.size <= size:
+                    crc, pri, delay, ttr, length = _RECORD.unpack_from(
+                        buf, offset)
+                    start = offset + _RECORD.size
+                    end = start + length
+                    if end > size:
+                        break
+                    body = buf[start:end]
+                    check = zlib.crc32(buf[offset + 4:start] + body)
+                    if check & 0xffffffff != crc:
+                        break
+                    offset = end
+                    yield (segment, offset), (body.decode(), pri, delay, ttr)
+
+    def _records(self, position, limit):
+        segment, offset = position
+        count = 0
+        for seg in self._segments:
+            if seg < segment:
+                continue
+            for item in self._scan(seg, offset if seg == segment else 0):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield item
+
+    def read(self, limit=100):
+        """Return up to `limit` unacknowledged ``(position, record)`` pairs,
+        a record is ``(data, pri, delay, ttr)``."""
+        return list(self._records(self._checkpoint, limit))
+
+    def ack(self, position, count):
+        """Acknowledge `count` records up to `position` and delete
+        segments that are fully acknowledged."""
+        segment, offset = position
+        # everything in the segment is acked, continue at the next one
+        if segment != self._segments[-1] and offset >= os.path.getsize(
+                self._path(segment)):
+            segment, offset = segment + 1, 0
+        self._checkpoint = segment, offset
+        self.pending = max(self.pending - count, 0)
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+        os.replace(path + '.tmp', path)
+        while self._segments[0] < segment:
+            os.remove(self._path(self._segments.pop(0)))
+
+
+class SpooledProducer:
+    """Producer that never waits for an unhealthy server.
+
+    :param spool: ``Spool`` for jobs that can not be put right away
+    :param tube: ``str`` tube jobs are put into
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param max_inflight: ``int`` puts awaiting a reply above which new jobs
+        go to the spool
+    :param batch_size: ``int`` number of spooled jobs replayed per write
+    :param retry_interval: ``float`` seconds to wait before talking to an
+        unavailable server again
+    :param options: socket options passed to `connect`
+    """
+
+    def __init__(self, spool, tube='default', host='localhost', port=11300,
+                 max_inflight=1000, batch_size=100, retry_interval=1.0,
+                 **options):
+        self.spool = spool
+        self.tube = tube
+        self.host, self.port = host, port
+        self.max_inflight = max_inflight
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self._options = options
+
+        self.inflight = 0
+        self._bs = None
+        self._connecting = None
+        self._unavailable_until = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def available(self):
+        return (self._bs is not None and
+                time.monotonic() >= self._unavailable_until)
+
+    def start(self):
+        """Start the background flusher, it also connects."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._drop_connection()
+        self.spool.close()
+
+    async def put(self, data, pri=1, delay=0, ttr=60):
+        """Put a job, returns the server reply or ``{'state': 'spooled'}``
+        if the job went to the spool."""
+        if (not self.available or self.spool.pending or
+                self.inflight >= self.max_inflight):
+            return self._spool(data, pri, delay, ttr)
+        # build the command first, so invalid jobs raise right here
+        command = handlers.process_put(data, pri, delay, ttr)
+        self.inflight += 1
+        try:
+            return await self._bs._cmd(*command)
+        except _UNAVAILABLE as exc:
+            await self._unavailable(exc)
+            return self._spool(data, pri, delay, ttr)
+        finally:
+            self.inflight -= 1
+
+    def _spool(self, data, pri, delay, ttr):
+        self.spool.append(data, pri, delay, ttr)
+        self._wakeup.set()
+        return {'state': 'spooled'}
+
+    async def _unavailable(self, exc):
+        logger.warning("Beanstalk unavailable, spooling jobs: {!r}"
+                       .format(exc))
+        self._unavailable_until = time.monotonic() + self.retry_interval
+        if not isinstance(exc, BeanstalkException):
+            await self._drop_connection()
+
+    async def _drop_connection(self):
+        bs, self._bs = self._bs, None
+        if bs is not None:
+            await bs.close()
+
+    async def _connect(self):
+        bs = await connect(self.host, self.port, **self._options)
+        if self.tube != 'default':
+            await bs.use(self.tube)
+        self._bs = bs
+
+    async def _wait(self, timeout):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _flush(self):
+        while True:
+            try:
+                if self._bs is None:
+                    await self._connect()
+                delay = self._unavailable_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not self.spool.pending:
+                    await self._wait(None)
+                    continue
+                await self._replay()
+            except asyncio.CancelledError:
+                raise
+            except _UNAVAILABLE as exc:
+                await self._unavailable(exc)
+                await asyncio.sleep(self.retry_interval)
+            except Exception:
+                logger.exception("Failed to replay spooled jobs")
+                await asyncio.sleep(self.retry_interval)
+
+    async def _replay(self):
+        records = self.spool.read(self.batch_size)
+        if not records:
+            return
+        commands = []
+        for _, (data, pri, delay, ttr) in records:
+            commands.append(handlers.process_put(data, pri, delay, ttr))
+        replies = await self._bs.pipeline(commands, return_exceptions=True)
+        acked, done = None, 0
+        for (position, _), reply in zip(records, replies):
+            if isinstance(reply, BSJobTooBig):
+                logger.error("Dropping spooled job: {!r}".format(reply))
+            elif isinstance(reply, Exception):
+                break
+            acked, done = position, done + 1
+        if acked is not None:
+            self.spool.ack(acked, done)
+        if done < len(records):
+            raise replies[done]
@@ -0,0 +1,172 @@
+"""
+Shared poller of server and tube statistics.
+
+One `StatsMonitor` fetches ``stats`` and ``stats-tube`` for every tube with
+a single pipelined write, caches the parsed replies and computes per second
+rates between two polls. Any number of consumers can read the cache or
+subscribe to updates while only one polling loop talks to the server.
+"""
+import asyncio
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.exceptions import BeanstalkException
+from aiobeanstalk.log import logger
+
+
+# cumulative counters turned into per second rates, key is the rate name
+TUBE_RATES = {
+    'puts': 'total-jobs',
+    'deletes': 'cmd-delete',
+}
+
+SERVER_RATES = {
+    'puts': 'cmd-put',
+    'reserves': ('cmd-reserve', 'cmd-reserve-with-timeout'),
+    'deletes': 'cmd-delete',
+    'releases': 'cmd-release',
+    'buries': 'cmd-bury',
+    'timeouts': 'job-timeouts',
+}
+
+
+def _counter(stats, keys):
+    if isinstance(keys, str):
+        keys = (keys,)
+    return sum(stats.get(key, 0) for key in keys)
+
+
+def compute_rates(prev, cur, elapsed, counters):
+    """Rates of change of the cumulative `counters` between two stats
+    snapshots taken `elapsed` seconds apart.
+
+    :param prev: ``dict`` previous stats, may be ``None``
+    :param cur: ``dict`` current stats
+    :param elapsed: ``float`` seconds between the snapshots
+    :param counters: ``dict`` rate name to stats key (or tuple of keys)
+    :return: ``dict`` with ``<name>_per_sec`` entries and ``ready_delta``,
+        empty if there is nothing to compare with
+    """
+    if not prev or elapsed <= 0:
+        return {}
+    rates = {}
+    for name, keys in counters.items():
+        delta = _counter(cur, keys) - _counter(prev, keys)
+        # counters go back to zero when the server restarts
+        rates[name + '_per_sec'] = max(delta, 0) / elapsed
+    rates['ready_delta'] = (cur.get('current-jobs-ready', 0) -
+                            prev.get('current-jobs-ready', 0))
+    return rates
+
+
+class StatsMonitor:
+    """Polls statistics of all tubes on the server.
+
+    :param bs: ``Beanstalk`` connection used for polling, it should not be
+        used for blocking commands such as ``reserve``
+    :param interval: ``float`` seconds between polls of the background loop
+    :param ttl: ``float`` age in seconds after which `get` polls again,
+        defaults to `interval`
+    """
+
+    def __init__(self, bs, interval=1.0, ttl=None):
+        self._bs = bs
+        self.interval = interval
+        self.ttl = interval if ttl is None else ttl
+        self._subscribers = []
+        self._polling = None
+        self._task = None
+
+        self.server = {}
+        self.server_rates = {}
+        self.tubes = {}
+        self.rates = {}
+        self.updated = None
+
+    def subscribe(self, callback):
+        """Call ``callback(monitor)`` after every poll."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    @property
+    def fresh(self):
+        return (self.updated is not None and
+                time.monotonic() - self.updated < self.ttl)
+
+    async def get(self, tube=None):
+        """Return cached stats of `tube` (or of the server if omitted),
+        polling first if the cache is older than `ttl`."""
+        if not self.fresh:
+            await self.poll()
+        if tube is None:
+            return self.server
+        return self.tubes.get(tube)
+
+    async def poll(self):
+        """Refresh the cache. Concurrent callers share one request."""
+        if self._polling is None:
+            self._polling = asyncio.create_task(self._poll())
+        polling = self._polling
+        try:
+            await asyncio.shield(polling)
+        finally:
+            if self._polling is polling and polling.done():
+                self._polling = None
+
+    async def _poll(self):
+        tubes = (await self._bs.list_tubes())['data']
+        commands = [handlers.process_stats()]
+        commands.extend(handlers.process_stats_tube(tube) for tube in tubes)
+        replies = await self._bs.pipeline(
+            commands, return_exceptions=True)
+        now = time.monotonic()
+        elapsed = now - self.updated if self.updated is not None else 0
+
+        server = replies[0]
+        if isinstance(server, Exception):
+            raise server
+        self.server_rates = compute_rates(
+            self.server, server['data'], elapsed, SERVER_RATES)
+        self.server = server['data']
+
+        tube_stats, rates = {}, {}
+        for tube, reply in zip(tubes, replies[1:]):
+            # tube may be gone between list-tubes and stats-tube
+            if isinstance(reply, BeanstalkException):
+                continue
+            if isinstance(reply, Exception):
+                raise reply
+            tube_stats[tube] = reply['data']
+            rates[tube] = compute_rates(
+                self.tubes.get(tube), reply['data'], elapsed, TUBE_RATES)
+        self.tubes, self.rates, self.updated = tube_stats, rates, now
+
+        for callback in list(self._subscribers):
+            try:
+                callback(self)
+            except Exception:
+                logger.exception("Stats subscriber {!r} failed"
+                                 .format(callback))
+
+    def start(self):
+        """Start the background polling loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to poll beanstalk stats")
+            await asyncio.sleep(self.interval)
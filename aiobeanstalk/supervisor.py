@@ -0,0 +1,236 @@
+"""
+Runs a `Worker` in several processes to use every CPU core.
+
+Each process has its own event loop and connections. On ``SIGTERM`` or
+``SIGINT`` workers drain: they stop reserving, finish the jobs in flight and
+release prefetched ones. Crashed workers are restarted and the metrics of all
+workers are aggregated in the supervisor::
+
+    python -m aiobeanstalk.supervisor myapp.jobs:handle -t emails -w 4
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from aiobeanstalk.log import logger
+from aiobeanstalk.worker import Worker
+
+
+def import_handler(handler):
+    """Resolve a ``'package.module:function'`` string to the function."""
+    if callable(handler):
+        return handler
+    module_name, sep, name = handler.partition(':')
+    if not sep or not name:
+        raise ValueError('Handler must look like "module:function", got {!r}'
+                         .format(handler))
+    return getattr(importlib.import_module(module_name), name)
+
+
+def aggregate_metrics(metrics):
+    """Combine per worker metrics: counters and slots are summed, latency is
+    averaged over the workers that measured one."""
+    total = {}
+    latencies = []
+    for worker_metrics in metrics:
+        for key, value in worker_metrics.items():
+            if key == 'latency':
+                if value is not None:
+                    latencies.append(value)
+            else:
+                total[key] = total.get(key, 0) + value
+    total['latency'] = sum(latencies) / len(latencies) if latencies else None
+    return total
+
+
+async def _run_worker(index, handler, tubes, host, port, options,
+                      metrics_queue, interval):
+    loop = asyncio.get_running_loop()
+    worker = Worker(import_handler(handler), tubes, host, port, **options)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, worker.stop)
+
+    def snapshot():
+        return dict(worker.metrics, slots=worker.slots,
+                    latency=worker.latency)
+
+    def report():
+        metrics_queue.put((index, os.getpid(), snapshot()))
+        loop.call_later(interval, report)
+
+    try:
+        await worker.start()
+        report()
+        await worker.join()
+    finally:
+        metrics_queue.put((index, os.getpid(), snapshot()))
+
+
+def _worker_main(*args):
+    asyncio.run(_run_worker(*args))
+
+
+class Supervisor:
+    """Starts `workers` processes each running a `Worker`.
+
+    :param handler: ``'module:function'`` path of the job handler, a
+        callable works too when processes are forked
+    :param tubes: ``list`` of tube names to watch
+    :param workers: ``int`` number of processes, one per CPU by default
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param worker_options: ``dict`` extra `Worker` arguments
+    :param metrics_interval: ``float`` seconds between metrics reports
+    :param drain_timeout: ``float`` seconds workers get to drain on stop
+        before they are killed
+    :param restart_delay: ``float`` seconds to wait before restarting a
+        crashed worker
+    """
+
+    def __init__(self, handler, tubes=('default',), workers=None,
+                 host='localhost', port=11300, worker_options=None,
+                 metrics_interval=5.0, drain_timeout=30.0, restart_delay=1.0):
+        self.handler = handler
+        self.tubes = list(tubes)
+        self.workers = workers or multiprocessing.cpu_count()
+        self.host, self.port = host, port
+        self.worker_options = worker_options or {}
+        self.metrics_interval = metrics_interval
+        self.drain_timeout = drain_timeout
+        self.restart_delay = restart_delay
+
+        self.restarts = 0
+        self._processes = {}
+        self._restart_at = {}
+        self._metrics = {}
+        # totals of worker processes that are gone
+        self._retired = {}
+        self._queue = multiprocessing.Queue()
+        self._stopping = False
+
+    @property
+    def metrics(self):
+        """Metrics aggregated over all current and past workers."""
+        metrics = aggregate_metrics(list(self._metrics.values()) +
+                                    [self._retired])
+        metrics['restarts'] = self.restarts
+        return metrics
+
+    def _spawn(self, index):
+        process = multiprocessing.Process(
+            target=_worker_main, name='aiobeanstalk-worker-{}'.format(index),
+            args=(index, self.handler, self.tubes, self.host, self.port,
+                  self.worker_options, self._queue, self.metrics_interval))
+        process.start()
+        self._processes[index] = process
+        logger.info("Started worker {} (pid {})".format(index, process.pid))
+
+    def _retire(self, index):
+        metrics = self._metrics.pop(index, None)
+        if metrics is not None:
+            metrics = dict(metrics, slots=0, latency=None)
+            self._retired = aggregate_metrics([self._retired, metrics])
+            del self._retired['latency']
+
+    def _collect(self, timeout):
+        try:
+            index, pid, metrics = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        process = self._processes.get(index)
+        if process is not None and process.pid == pid:
+            self._metrics[index] = metrics
+
+    def _check(self):
+        now = time.monotonic()
+        for index, process in list(self._processes.items()):
+            if process.is_alive():
+                continue
+            if index not in self._restart_at:
+                logger.warning("Worker {} (pid {}) exited with {}".format(
+                    index, process.pid, process.exitcode))
+                self._retire(index)
+                self._restart_at[index] = now + self.restart_delay
+            elif now >= self._restart_at[index]:
+                del self._restart_at[index]
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop(self, *args):
+        self._stopping = True
+
+    def run(self):
+        """Start the workers and supervise them until `stop` is called or
+        the process receives ``SIGTERM``/``SIGINT``."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+        for index in range(self.workers):
+            self._spawn(index)
+
+        reported = time.monotonic()
+        while not self._stopping:
+            self._collect(timeout=0.5)
+            self._check()
+            if time.monotonic() - reported >= self.metrics_interval:
+                reported = time.monotonic()
+                logger.info("Workers metrics: {}".format(self.metrics))
+        self._drain()
+
+    def _drain(self):
+        logger.info("Draining {} workers".format(len(self._processes)))
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.drain_timeout
+        for process in self._processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning("Killing worker pid {}".format(process.pid))
+                process.kill()
+                process.join()
+        while True:
+            try:
+                index, pid, metrics = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._metrics[index] = metrics
+        for index in list(self._metrics):
+            self._retire(index)
+        logger.info("Workers metrics: {}".format(self.metrics))
+
+
+ARGS = argparse.ArgumentParser(description="Run beanstalk workers.")
+ARGS.add_argument('handler', help='job handler as "module:function"')
+ARGS.add_argument('-t', '--tube', action='append', dest='tubes',
+                  help='tube to watch, may be repeated')
+ARGS.add_argument('-w', '--workers', type=int, default=None,
+                  help='number of processes (default: number of CPUs)')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+ARGS.add_argument('--min-slots', type=int, default=1)
+ARGS.add_argument('--max-slots', type=int, default=8)
+ARGS.add_argument('--prefetch', type=int, default=0)
+ARGS.add_argument('--drain-timeout', type=float, default=30.0)
+ARGS.add_argument('-v', action='store_true', dest='verbose')
+
+
+def main(argv=None):
+    args = ARGS.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    supervisor = Supervisor(
+        args.handler, args.tubes or ['default'], args.workers,
+        args.host, args.port, drain_timeout=args.drain_timeout,
+        worker_options={'min_slots': args.min_slots,
+                        'max_slots': args.max_slots,
+                        'prefetch': args.prefetch})
+    supervisor.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+End-to-end latency tracing of jobs.
+
+`Tracer` wraps a connection and stamps the enqueue time, a trace id and the
+producer id into the envelope header on ``put``. On ``reserve`` the header is
+stripped and on ``delete`` the queue wait, processing and total times of the
+job are reported to a hook::
+
+    def report(trace):
+        print(trace['trace_id'], trace['queue_wait'], trace['processing'])
+
+    tracer = Tracer(bs, producer_id='billing', hook=report)
+    await tracer.put('{"nice":"job"}')
+
+Producer and consumer clocks are assumed to be in sync, queue wait does not
+include the ``delay`` the job was put with.
+"""
+import asyncio
+import time
+import uuid
+
+from aiobeanstalk import envelope
+
+
+class Tracer:
+    """Traces jobs put, reserved and deleted through connection `bs`, any
+    other command is passed to the connection as is.
+
+    :param bs: ``Beanstalk`` connection
+    :param producer_id: ``str`` stamped into jobs put by this tracer
+    :param hook: callable invoked with a ``dict`` of timings for every
+        traced job that is deleted
+    :param clock: callable returning the wall clock time in seconds
+    """
+
+    def __init__(self, bs, producer_id=None, hook=None, clock=time.time):
+        self._bs = bs
+        self.producer_id = producer_id
+        self.hook = hook
+        self._clock = clock
+        # jid -> (meta, reserved timestamp) of reserved traced jobs
+        self._reserved = {}
+
+    def __getattr__(self, attr):
+        return getattr(self._bs, attr)
+
+    def put(self, data, pri=1, delay=0, ttr=60, trace_id=None, **meta):
+        """Put a job stamped with the trace metadata. Extra keyword
+        arguments are added to the envelope header."""
+        meta.update(ts=self._clock(), trace_id=trace_id or uuid.uuid4().hex)
+        if delay:
+            meta['delay'] = delay
+        if self.producer_id is not None:
+            meta['producer'] = self.producer_id
+        return self._bs.put(envelope.pack(data, **meta), pri, delay, ttr)
+
+    async def reserve(self):
+        return self._received(await self._bs.reserve())
+
+    async def reserve_with_timeout(self, timeout=0):
+        return self._received(
+            await self._bs.reserve_with_timeout(timeout))
+
+    def _received(self, job):
+        if job.get('state') != 'ok':
+            return job
+        meta, job['data'] = envelope.unpack(job['data'])
+        job['meta'] = meta
+        if 'ts' in meta:
+            self._reserved[job['jid']] = meta, self._clock()
+        return job
+
+    async def delete(self, jid):
+        reply = await self._bs.delete(jid)
+        traced = self._reserved.pop(jid, None)
+        if traced is not None and self.hook is not None:
+            self.hook(self.timings(jid, *traced))
+        return reply
+
+    def release(self, jid, *args, **kw):
+        self._reserved.pop(jid, None)
+        return self._bs.release(jid, *args, **kw)
+
+    def bury(self, jid, *args, **kw):
+        self._reserved.pop(jid, None)
+        return self._bs.bury(jid, *args, **kw)
+
+    def timings(self, jid, meta, reserved):
+        now = self._clock()
+        ready = meta['ts'] + meta.get('delay', 0)
+        return {
+            'jid': jid,
+            'trace_id': meta.get('trace_id'),
+            'producer': meta.get('producer'),
+            'queue_wait': max(reserved - ready, 0),
+            'processing': now - reserved,
+            'total': now - meta['ts'],
+        }
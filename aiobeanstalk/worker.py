@@ -0,0 +1,263 @@
+"""
+Consumer that scales the number of concurrent reserve loops with load.
+
+Every reserve slot owns its own connection, since ``reserve`` blocks the
+connection it is sent on. A controller compares the number of ready jobs in
+the watched tubes with the measured handler latency and grows or shrinks the
+number of slots between `min_slots` and `max_slots`. Overload replies from
+the server (``DEADLINE_SOON``, ``OUT_OF_MEMORY``) halve the number of slots
+and pause growth for a while.
+"""
+import asyncio
+import math
+import time
+
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.exceptions import BSTimedOut, BSDeadlineSoon, \
+    BSOutOfMemory, BeanstalkException
+from aiobeanstalk.log import logger
+from aiobeanstalk.prefetch import PrefetchBuffer
+from aiobeanstalk.retry import Retrier
+from aiobeanstalk.stats import StatsMonitor
+
+
+class Worker:
+    """Runs `handler` for jobs reserved from `tubes`.
+
+    The job is deleted when the handler returns and retried according to
+    `policy` when it raises.
+
+    :param handler: coroutine function called as ``handler(job)``
+    :param tubes: ``list`` of tube names to watch
+    :param host: ``str`` beanstalkd server host
+    :param port: ``int`` beanstalkd server port
+    :param min_slots: ``int`` lower bound of concurrent reserve loops
+    :param max_slots: ``int`` upper bound of concurrent reserve loops
+    :param interval: ``float`` seconds between two scaling decisions
+    :param reserve_timeout: ``int`` seconds a slot waits for a job before
+        checking whether it should stop
+    :param policy: ``RetryPolicy`` for failed jobs
+    :param backoff: ``float`` seconds to wait after an overload reply
+    :param prefetch: ``int`` number of jobs every slot reserves ahead and
+        hands out by priority, see `PrefetchBuffer`
+    :param prefetch_options: ``dict`` extra `PrefetchBuffer` arguments
+    :param on_result: callable invoked as ``on_result(job, latency, ok)``
+        after every job
+    :param batch_size: ``int`` if above 1, every slot reserves up to this
+        many jobs at once with `Beanstalk.reserve_many` and the handler is
+        called with the list of jobs
+    """
+
+    def __init__(self, handler, tubes=('default',), host='localhost',
+                 port=11300, min_slots=1, max_slots=8, interval=1.0,
+                 reserve_timeout=1, policy=None, backoff=1.0, prefetch=0,
+                 prefetch_options=None, on_result=None, batch_size=1):
+        if not 0 < min_slots <= max_slots:
+            raise ValueError('expected 0 < min_slots <= max_slots')
+        if prefetch and batch_size > 1:
+            raise ValueError('prefetch and batch_size are exclusive')
+        self.handler = handler
+        self.tubes = list(tubes)
+        self.host, self.port = host, port
+        self.min_slots, self.max_slots = min_slots, max_slots
+        self.interval = interval
+        self.reserve_timeout = reserve_timeout
+        self.policy = policy
+        self.backoff = backoff
+        self.prefetch = prefetch
+        self.prefetch_options = prefetch_options or {}
+        self.on_result = on_result
+        self.batch_size = batch_size
+
+        self.target = min_slots
+        self._slots = {}
+        self._stopping = False
+        self._cooldown_until = 0
+        self._controller = None
+        self._monitor = None
+        self._control_bs = None
+
+        # exponentially weighted moving average of handler latency
+        self.latency = None
+        self.metrics = {'processed': 0, 'failed': 0, 'released': 0,
+                        'overloads': 0}
+
+    @property
+    def slots(self):
+        return len(self._slots)
+
+    async def start(self):
+        """Open the control connection and start consuming."""
+        self._control_bs = await connect(self.host, self.port)
+        self._monitor = StatsMonitor(self._control_bs, self.interval)
+        self._resize()
+        self._controller = asyncio.create_task(self._control())
+
+    def stop(self):
+        """Stop reserving new jobs, jobs in flight are finished."""
+        self._stopping = True
+        if self._controller is not None:
+            self._controller.cancel()
+
+    async def join(self):
+        """Wait until the worker is stopped and every slot has finished its
+        job and closed."""
+        if self._controller is not None:
+            await asyncio.wait([self._controller])
+        while self._slots:
+            await asyncio.wait(list(self._slots.values()))
+        if self._control_bs is not None:
+            await self._control_bs.close()
+            self._control_bs = None
+
+    def record(self, latency, alpha=0.2):
+        """Add a handler latency sample to the moving average."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += alpha * (latency - self.latency)
+
+    def desired_slots(self, ready):
+        """Number of slots needed to process `ready` jobs within one
+        interval at the measured latency."""
+        if not ready:
+            return self.min_slots
+        latency = self.latency if self.latency is not None else self.interval
+        wanted = math.ceil(ready * latency / self.interval)
+        return min(max(wanted, self.min_slots), self.max_slots)
+
+    def overloaded(self):
+        """Halve the number of slots and hold growth for a while."""
+        self.metrics['overloads'] += 1
+        self.target = max(self.target // 2, self.min_slots)
+        self._cooldown_until = time.monotonic() + self.backoff * 4
+
+    async def _control(self):
+        while not self._stopping:
+            try:
+                await self._monitor.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Failed to poll tube stats")
+            else:
+                ready = sum(self._monitor.tubes.get(tube, {})
+                            .get('current-jobs-ready', 0)
+                            for tube in self.tubes)
+                wanted = self.desired_slots(ready)
+                if wanted > self.target:
+                    if time.monotonic() >= self._cooldown_until:
+                        self.target = wanted
+                elif wanted < self.target:
+                    # shrink one slot at a time to avoid flapping
+                    self.target -= 1
+                self._resize()
+            await asyncio.sleep(self.interval)
+
+    def _resize(self):
+        for slot_id in range(self.target):
+            if slot_id not in self._slots:
+                task = asyncio.create_task(self._slot(slot_id))
+                self._slots[slot_id] = task
+                task.add_done_callback(
+                    lambda _, slot_id=slot_id: self._slots.pop(slot_id, None))
+
+    def _should_run(self, slot_id):
+        return not self._stopping and slot_id < self.target
+
+    async def _watch(self, bs):
+        # a new connection watches only the default tube, so the watch list
+        # is set up with a single write
+        commands = [handlers.process_watch(tube) for tube in self.tubes]
+        if 'default' not in self.tubes:
+            commands.append(handlers.process_ignore('default'))
+        await bs.pipeline(commands)
+
+    async def _slot(self, slot_id):
+        try:
+            bs = await connect(self.host, self.port)
+        except Exception:
+            logger.exception("Slot {} failed to connect".format(slot_id))
+            return
+        retrier = Retrier(bs, self.policy)
+        buffer = None
+        try:
+            await self._watch(bs)
+            if self.prefetch:
+                buffer = PrefetchBuffer(
+                    bs, self.prefetch, reserve_timeout=self.reserve_timeout,
+                    on_overload=self.overloaded,
+                    **self.prefetch_options)
+                buffer.start()
+            while self._should_run(slot_id):
+                try:
+                    jobs = await self._reserve(bs, buffer)
+                except BSTimedOut:
+                    continue
+                except (BSDeadlineSoon, BSOutOfMemory) as exc:
+                    logger.warning("Slot {} backing off: {!r}"
+                                   .format(slot_id, exc))
+                    self.overloaded()
+                    await asyncio.sleep(self.backoff)
+                    continue
+                if not jobs:
+                    continue
+                if self._stopping:
+                    await bs.pipeline(
+                        [handlers.process_release(job['jid'],
+                                                  job.get('pri', 1))
+                         for job in jobs], return_exceptions=True)
+                    self.metrics['released'] += len(jobs)
+                    break
+                await self._process(bs, retrier, jobs)
+            if buffer is not None:
+                await buffer.close()
+        except Exception:
+            logger.exception("Slot {} failed".format(slot_id))
+        finally:
+            await bs.close()
+
+    async def _reserve(self, bs, buffer):
+        if self.batch_size > 1:
+            return await bs.reserve_many(self.batch_size,
+                                         self.reserve_timeout)
+        if buffer is not None:
+            job = await buffer.get(self.reserve_timeout)
+        else:
+            job = await bs.reserve_with_timeout(self.reserve_timeout)
+        return [job] if job.get('state') == 'ok' else []
+
+    def _done(self, jobs, latency, ok):
+        # a batch is accounted as jobs of equal latency
+        latency /= len(jobs)
+        for job in jobs:
+            self.record(latency)
+            if self.on_result is not None:
+                self.on_result(job, latency, ok)
+
+    async def _process(self, bs, retrier, jobs):
+        started = time.monotonic()
+        try:
+            await self.handler(jobs if self.batch_size > 1 else jobs[0])
+        except Exception:
+            logger.exception("Handler failed on jobs {}".format(
+                ', '.join(str(job['jid']) for job in jobs)))
+            self._done(jobs, time.monotonic() - started, False)
+            self.metrics['failed'] += len(jobs)
+            acks = [retrier.fail(job, job.get('pri')) for job in jobs]
+            replies = await asyncio.gather(*acks, return_exceptions=True)
+        else:
+            self._done(jobs, time.monotonic() - started, True)
+            self.metrics['processed'] += len(jobs)
+            for job in jobs:
+                retrier.succeeded(job)
+            replies = await bs.delete_many([job['jid'] for job in jobs])
+        for job, reply in zip(jobs, replies):
+            if isinstance(reply, BeanstalkException):
+                # most likely the TTR expired and the job was given to
+                # another consumer
+                logger.warning("Failed to ack job {}: {!r}"
+                               .format(job['jid'], reply))
+            elif isinstance(reply, Exception):
+                raise reply
@@ -0,0 +1,99 @@
+"""
+Client side cost of a command.
+
+Puts `--count` jobs over one connection, first awaiting every reply before
+the next put, then with `--depth` puts in flight at once, and reports the
+throughput of both::
+
+    python benchmarks/hot_path.py --count 100000 --stand-in
+
+With ``--stand-in`` the puts go to a local server run in a child process that
+answers every put with ``INSERTED``, so no beanstalkd is needed and the
+numbers are dominated by the client.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from aiobeanstalk import connect
+
+ARGS = argparse.ArgumentParser(description="Measure put throughput.")
+ARGS.add_argument('--count', type=int, default=100000)
+ARGS.add_argument('--depth', type=int, default=100,
+                  help='puts in flight in the concurrent run')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+ARGS.add_argument('--tube', default='hot-path')
+ARGS.add_argument('--stand-in', action='store_true',
+                  help='connect to a local stand-in server')
+
+
+def serve(port, ready):
+
+    async def handle(reader, writer):
+        jid = 0
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'put '):
+                await reader.readline()
+                jid += 1
+                writer.write(b'INSERTED %d\r\n' % jid)
+            else:
+                writer.write(b'USING hot-path\r\n')
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', port)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+async def sequential(bs, count):
+    for _ in range(count):
+        await bs.put('x' * 64)
+
+
+async def concurrent(bs, count, depth):
+    for start in range(0, count, depth):
+        await asyncio.gather(*[bs.put('x' * 64)
+                               for _ in range(min(depth, count - start))])
+
+
+async def measure(args):
+    async with connect(args.host, args.port) as bs:
+        await bs.use(args.tube)
+        runs = [('sequential', sequential(bs, args.count)),
+                ('depth {}'.format(args.depth),
+                 concurrent(bs, args.count, args.depth))]
+        for name, coro in runs:
+            started = time.perf_counter()
+            await coro
+            elapsed = time.perf_counter() - started
+            print('{:>12}: {:.0f} puts/s, {:.1f} us per put'.format(
+                name, args.count / elapsed, elapsed / args.count * 1e6))
+
+
+def main():
+    args = ARGS.parse_args()
+    server = None
+    if args.stand_in:
+        args.host = '127.0.0.1'
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=serve, args=(args.port, ready), daemon=True)
+        server.start()
+        ready.wait()
+
+    asyncio.run(measure(args))
+
+    if server is not None:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
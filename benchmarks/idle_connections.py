@@ -0,0 +1,109 @@
+"""
+Resident memory per idle connection.
+
+Opens `--count` connections with either connection type, has each of them
+watch a tube, then reports the growth of the process RSS per connection::
+
+    python benchmarks/idle_connections.py --count 10000 --mode lean
+    python benchmarks/idle_connections.py --count 10000 --mode stream
+
+With ``--stand-in`` the connections go to a local server run in a child
+process that answers every command with ``WATCHING 2``, so no beanstalkd is
+needed and the server side sockets are not counted.
+"""
+import argparse
+import asyncio
+import gc
+import multiprocessing
+import os
+import resource
+
+from aiobeanstalk import connect
+from aiobeanstalk.lean import lean_connect
+
+ARGS = argparse.ArgumentParser(description="Measure RSS per idle connection.")
+ARGS.add_argument('--count', type=int, default=10000)
+ARGS.add_argument('--mode', choices=['lean', 'stream'], default='lean')
+ARGS.add_argument('--host', default='localhost')
+ARGS.add_argument('--port', type=int, default=11300)
+ARGS.add_argument('--tube', default='idle')
+ARGS.add_argument('--stand-in', action='store_true',
+                  help='connect to a local stand-in server')
+
+
+def rss():
+    """Current resident set size in bytes."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def raise_fd_limit(count):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = count + 256
+    if soft < wanted:
+        wanted = wanted if hard == resource.RLIM_INFINITY \
+            else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def serve(port, count, ready):
+    raise_fd_limit(count)
+
+    async def handle(reader, writer):
+        while (await reader.readline()):
+            writer.write(b'WATCHING 2\r\n')
+
+    async def run():
+        server = await asyncio.start_server(handle, '127.0.0.1', port,
+                                            backlog=1024)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+async def open_connections(args):
+    factory = lean_connect if args.mode == 'lean' else connect
+    connections = []
+    # a bounded number of handshakes in flight keeps the accept queue sane
+    for start in range(0, args.count, 500):
+        batch = await asyncio.gather(*[
+            factory(args.host, args.port)
+            for _ in range(start, min(start + 500, args.count))])
+        await asyncio.gather(*[bs.watch(args.tube) for bs in batch])
+        connections.extend(batch)
+    return connections
+
+
+async def measure(args):
+    gc.collect()
+    before = rss()
+    connections = await open_connections(args)
+    gc.collect()
+    after = rss()
+    print('{} {} connections: {:.1f} MiB, {:.0f} bytes per connection'.format(
+        len(connections), args.mode, (after - before) / 2**20,
+        (after - before) / len(connections)))
+
+
+def main():
+    args = ARGS.parse_args()
+    raise_fd_limit(args.count)
+    server = None
+    if args.stand_in:
+        args.host = '127.0.0.1'
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=serve, args=(args.port, args.count, ready), daemon=True)
+        server.start()
+        ready.wait()
+
+    asyncio.run(measure(args))
+
+    if server is not None:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
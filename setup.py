@@ -23,6 +23,9 @@ setup(name='aiobeanstalk',
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: POSIX',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Communications',
         'Topic :: Internet',
         'Topic :: Scientific/Engineering',
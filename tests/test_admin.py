@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+import yaml
+from aiobeanstalk.admin import JobScanner, process_jobs
+from aiobeanstalk.exceptions import BSNotFount
+
+
+def _stats(data):
+    body = yaml.safe_dump(data)
+    return 'OK {}\r\n{}\r\n'.format(len(body), body)
+
+
+class FakeBeanstalk:
+    """Answers commands from a table of canned replies"""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.writes = []
+
+    async def pipeline(self, commands, return_exceptions=False):
+        self.writes.append([command for command, _ in commands])
+        results = []
+        for command, handler in commands:
+            reply = self.replies.get(command.strip(), 'NOT_FOUND\r\n')
+            results.append(BSNotFount() if reply == 'NOT_FOUND\r\n'
+                           else handler(reply))
+        return results
+
+
+class JobScannerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        replies = {
+            'stats': _stats({'total-jobs': 8}),
+            'stats-tube foo': _stats({'current-jobs-buried': 2}),
+            'kick-job 2': 'KICKED\r\n',
+            'kick-job 5': 'KICKED\r\n',
+        }
+        jobs = {1: ('foo', 'ready'), 2: ('foo', 'buried'), 3: ('bar', 'buried'),
+                5: ('foo', 'buried'), 6: ('bar', 'delayed'),
+                7: ('foo', 'buried')}
+        for jid, (tube, state) in jobs.items():
+            replies['stats-job {}'.format(jid)] = _stats(
+                {'tube': tube, 'state': state, 'pri': 0, 'age': 1})
+            replies['peek {}'.format(jid)] = 'FOUND {} 4\r\njob{}\r\n'.format(
+                jid, jid)
+        self.bs = FakeBeanstalk(replies)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_scan_stops_when_all_jobs_are_found(self):
+        scanner = JobScanner(self.bs, 'foo', batch_size=2)
+        batches = []
+        while True:
+            jobs = self.loop.run_until_complete(scanner.next_batch())
+            if not jobs:
+                break
+            batches.append([(job['jid'], job['data']) for job in jobs])
+        self.assertEqual(batches, [[(2, 'job2')], [(5, 'job5')]])
+        # job 7 was never looked up
+        looked_up = [command for write in self.bs.writes for command in write]
+        self.assertIn('stats-job 6\r\n', looked_up)
+        self.assertNotIn('stats-job 7\r\n', looked_up)
+
+    def test_kick_matching_jobs(self):
+        count = self.loop.run_until_complete(process_jobs(
+            self.bs, 'foo', action='kick', batch_size=10,
+            predicate=lambda job: job['data'] != 'job7'))
+        self.assertEqual(count, 2)
+        self.assertEqual(self.bs.writes[-1], ['kick-job 2\r\n',
+                                              'kick-job 5\r\n'])
@@ -0,0 +1,130 @@
+import asyncio
+import io
+import unittest
+import yaml
+from aiobeanstalk.backup import MAGIC, export_tube, import_jobs, read_jobs, \
+    write_job
+
+
+def _stats(data):
+    body = yaml.safe_dump(data)
+    return 'OK {}\r\n{}\r\n'.format(len(body), body)
+
+
+class FakeBeanstalk:
+
+    def __init__(self, jobs):
+        # jid -> (tube, state, pri, delay, ttr, time-left, data)
+        self.jobs = jobs
+        self.published = []
+        self.deleted = []
+        self.watching = ['default']
+
+    def _reply(self, command):
+        name, *args = command.split()
+        if name == 'stats':
+            return _stats({'total-jobs': max(self.jobs)})
+        if name == 'stats-tube':
+            states = [job[1] for job in self.jobs.values()
+                      if job[0] == args[0]]
+            return _stats({'current-jobs-' + state: states.count(state)
+                           for state in ('ready', 'delayed', 'buried',
+                                         'reserved')})
+        job = self.jobs.get(int(args[0]))
+        if job is None:
+            return None
+        tube, state, pri, delay, ttr, left, data = job
+        if name == 'stats-job':
+            return _stats({'tube': tube, 'state': state, 'pri': pri,
+                           'delay': delay, 'ttr': ttr, 'time-left': left})
+        return 'FOUND {} {}\r\n{}\r\n'.format(args[0], len(data), data)
+
+    async def pipeline(self, commands, return_exceptions=False):
+        results = []
+        for command, handler in commands:
+            reply = self._reply(command.strip())
+            results.append(handler(reply) if reply else KeyError(command))
+        return results
+
+    async def watch(self, tube):
+        self.watching.append(tube)
+
+    async def ignore(self, tube):
+        self.watching.remove(tube)
+
+    async def reserve_many(self, max_jobs, timeout=None):
+        ready = [jid for jid, job in sorted(self.jobs.items())
+                 if job[0] in self.watching and job[1] == 'ready']
+        jobs = []
+        for jid in ready[:max_jobs]:
+            self.jobs[jid] = self.jobs[jid][:1] + ('reserved',) + \
+                self.jobs[jid][2:]
+            jobs.append({'jid': jid, 'data': self.jobs[jid][-1]})
+        return jobs
+
+    async def delete_many(self, jids):
+        for jid in jids:
+            del self.jobs[jid]
+            self.deleted.append(jid)
+
+    async def publish_batch(self, jobs):
+        self.published.append(jobs)
+
+
+class BackupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.bs = FakeBeanstalk({
+            1: ('foo', 'ready', 10, 0, 60, 0, 'one'),
+            2: ('bar', 'ready', 0, 0, 60, 0, 'other'),
+            3: ('foo', 'delayed', 20, 30, 120, 12, 'three'),
+            4: ('foo', 'ready', 30, 5, 60, 0, 'four'),
+        })
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_file_roundtrip(self):
+        f = io.BytesIO()
+        f.write(MAGIC)
+        write_job(f, 'body', 1, 2, 3)
+        write_job(f, 'été', 4, 5, 6)
+        f.seek(0)
+        self.assertEqual(list(read_jobs(f)), [('body', 1, 2, 3),
+                                              ('été', 4, 5, 6)])
+        with self.assertRaises(ValueError):
+            list(read_jobs(io.BytesIO(b'junk')))
+
+    def test_export_peeks_jobs(self):
+        out = io.BytesIO()
+        count = self.loop.run_until_complete(
+            export_tube(self.bs, 'foo', out, batch_size=2))
+        self.assertEqual(count, 3)
+        out.seek(0)
+        self.assertEqual(list(read_jobs(out)), [
+            ('one', 10, 0, 60), ('three', 20, 12, 120), ('four', 30, 0, 60)])
+        self.assertEqual(len(self.bs.jobs), 4)
+
+    def test_export_moves_ready_jobs(self):
+        out = io.BytesIO()
+        count = self.loop.run_until_complete(
+            export_tube(self.bs, 'foo', out, move=True, batch_size=1))
+        self.assertEqual(count, 2)
+        self.assertEqual(self.bs.deleted, [1, 4])
+        self.assertEqual(self.bs.watching, ['foo'])
+        out.seek(0)
+        self.assertEqual([job[0] for job in read_jobs(out)], ['one', 'four'])
+
+    def test_import_in_batches(self):
+        f = io.BytesIO()
+        f.write(MAGIC)
+        for i in range(5):
+            write_job(f, 'job{}'.format(i), i, 0, 60)
+        f.seek(0)
+        count = self.loop.run_until_complete(
+            import_jobs(self.bs, 'baz', f, batch_size=2))
+        self.assertEqual(count, 5)
+        self.assertEqual([len(batch) for batch in self.bs.published],
+                         [2, 2, 1])
+        self.assertEqual(self.bs.published[0][1], ('baz', 'job1', 1, 0, 60))
@@ -2,20 +2,20 @@ import asyncio
 import unittest
 import unittest.mock
 import aiobeanstalk
+from aiobeanstalk import handlers
+from aiobeanstalk.bsclient import Beanstalk
+from aiobeanstalk.exceptions import BSNotFount, BadFormatException
 
 
 def beanstalk_test(function):
     """Helper function base on redis_test from [0]
     https://github.com/jonathanslenders/asyncio-redis/blob/master/tests.py#L53
     """
-    function = asyncio.coroutine(function)
-
     def wrapper(self):
-        @asyncio.coroutine
-        def c():
+        async def c():
             # Create connection
-            bs = yield from aiobeanstalk.connect()
-            yield from function(self, bs)
+            async with aiobeanstalk.connect() as bs:
+                await function(self, bs)
         self.loop.run_until_complete(c())
     return wrapper
 
@@ -24,37 +24,144 @@ class BeanstalkProtocolTests(unittest.TestCase):
 
     def setUp(self):
         self.loop = asyncio.new_event_loop()
-        # asyncio.set_event_loop(None)
-        self.loop = asyncio.get_event_loop()
-
 
     def tearDown(self):
         self.loop.close()
 
     @beanstalk_test
-    def test_basics(self, bs):
+    async def test_basics(self, bs):
         """Test put-reserve-delete cycle"""
         tube = 'xxxtest'
 
-        use = yield from bs.use(tube)
+        use = await bs.use(tube)
         self.assertEqual(use['state'], "ok")
 
         # # put the job on the queue
-        put = yield from bs.put('test_data', 0, 0, 100)
+        put = await bs.put('test_data', 0, 0, 100)
         self.assertIsInstance(put['jid'], int)
 
         # watch the tube
-        watch = yield from bs.watch(tube)
+        watch = await bs.watch(tube)
         self.assertEqual(watch['state'], "ok")
         self.assertIsInstance(watch['count'], int)
 
         # dequeue job from tube
-        reserve = yield from bs.reserve()
+        reserve = await bs.reserve()
         self.assertEqual(reserve['jid'], put['jid'])
         self.assertEqual(reserve['state'], "ok")
 
         # remove job from tube
-        delete = yield from bs.delete(reserve['jid'])
+        delete = await bs.delete(reserve['jid'])
         self.assertEqual('ok', delete['state'])
 
 
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+class PipelineTests(unittest.TestCase):
+    """Run commands against canned replies instead of a server"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.reader = asyncio.StreamReader(loop=self.loop)
+        self.writer = FakeWriter()
+        self.bs = Beanstalk(self.reader, self.writer)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_with_replies(self, coro, *replies):
+        self.reader.feed_data(''.join(replies).encode())
+        return self.loop.run_until_complete(coro)
+
+    def test_pipeline(self):
+        commands = [handlers.process_use('foo'), handlers.process_delete(5)]
+        replies = self.run_with_replies(self.bs.pipeline(commands, True),
+                                        'USING foo\r\n', 'NOT_FOUND\r\n')
+        self.assertEqual(self.writer.data, b'use foo\r\ndelete 5\r\n')
+        self.assertEqual(replies[0], {'state': 'ok', 'tube': 'foo'})
+        self.assertIsInstance(replies[1], BSNotFount)
+
+    def test_publish_batch_groups_tubes(self):
+        jobs = [('a', 'x'), ('b', 'y', 5), ('a', 'z')]
+        replies = self.run_with_replies(
+            self.bs.publish_batch(jobs, return_exceptions=True),
+            'USING default\r\n', 'USING a\r\n', 'INSERTED 1\r\n',
+            'INSERTED 2\r\n', 'USING b\r\n', 'INSERTED 3\r\n',
+            'USING default\r\n')
+        self.assertEqual(self.writer.data, (
+            b'list-tube-used\r\n'
+            b'use a\r\nput 1 0 60 1\r\nx\r\nput 1 0 60 1\r\nz\r\n'
+            b'use b\r\nput 5 0 60 1\r\ny\r\n'
+            b'use default\r\n'))
+        self.assertEqual([reply['jid'] for reply in replies], [1, 3, 2])
+
+    def test_publish_batch_preserve_order(self):
+        jobs = [('default', 'x'), ('b', 'y'), ('default', 'z')]
+        replies = self.run_with_replies(
+            self.bs.publish_batch(jobs, preserve_order=True),
+            'USING default\r\n', 'USING default\r\n', 'INSERTED 1\r\n',
+            'USING b\r\n', 'INSERTED 2\r\n', 'USING default\r\n',
+            'INSERTED 3\r\n')
+        self.assertEqual([reply['jid'] for reply in replies], [1, 2, 3])
+        self.assertTrue(self.writer.data.endswith(b'z\r\n'))
+
+    def test_reserve_many(self):
+        jobs = self.run_with_replies(
+            self.bs.reserve_many(4, timeout=1),
+            'RESERVED 1 1\r\na\r\n', 'RESERVED 2 1\r\nb\r\n', 'TIMED_OUT\r\n',
+            'RESERVED 3 1\r\nc\r\n')
+        self.assertEqual(self.writer.data, b'reserve-with-timeout 1\r\n' +
+                         b'reserve-with-timeout 0\r\n' * 3)
+        self.assertEqual([job['jid'] for job in jobs], [1, 2, 3])
+
+    def test_reserve_many_timeout(self):
+        jobs = self.run_with_replies(self.bs.reserve_many(4, timeout=0),
+                                     'TIMED_OUT\r\n')
+        self.assertEqual(jobs, [])
+        self.assertEqual(self.writer.data, b'reserve-with-timeout 0\r\n')
+
+    def test_delete_many(self):
+        replies = self.run_with_replies(self.bs.delete_many([1, 2]),
+                                        'DELETED\r\n', 'NOT_FOUND\r\n')
+        self.assertEqual(self.writer.data, b'delete 1\r\ndelete 2\r\n')
+        self.assertEqual(replies[0], {'state': 'ok'})
+        self.assertIsInstance(replies[1], BSNotFount)
+
+    def test_watch_many(self):
+        count = self.run_with_replies(self.bs.watch_many(['a', 'b']),
+                                      'WATCHING 2\r\n', 'WATCHING 3\r\n')
+        self.assertEqual(count, 3)
+        self.assertEqual(self.writer.data, b'watch a\r\nwatch b\r\n')
+
+    def test_watch_many_checks_names_first(self):
+        with self.assertRaises(BadFormatException):
+            self.loop.run_until_complete(self.bs.watch_many(['a', '-bad']))
+        self.assertEqual(self.writer.data, b'')
+
+    def test_sync_watched(self):
+        body = '---\n- default\n- a\n- 42\n'
+        count = self.run_with_replies(
+            self.bs.sync_watched(['a', 'b', '42']),
+            'OK {}\r\n{}\r\n'.format(len(body), body),
+            'WATCHING 4\r\n', 'WATCHING 3\r\n')
+        self.assertEqual(count, 3)
+        self.assertEqual(self.writer.data, (b'list-tubes-watched\r\n'
+                                            b'watch b\r\nignore default\r\n'))
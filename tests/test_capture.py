@@ -0,0 +1,65 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from aiobeanstalk.bsclient import connect
+from aiobeanstalk.capture import Recorder, ReplayServer, read_log, replay, \
+    split_commands, command_handler, COMMAND, REPLY
+
+
+class CaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_log_roundtrip(self):
+        recorder = Recorder(self.path)
+        recorder.command(b'use foo\r\n')
+        recorder.reply(b'USING foo\r\n')
+        recorder.close()
+        entries = list(read_log(self.path))
+        self.assertEqual([(kind, data) for kind, _, data in entries],
+                         [(COMMAND, b'use foo\r\n'), (REPLY, b'USING foo\r\n')])
+        self.assertLessEqual(entries[0][1], entries[1][1])
+
+    def test_not_a_log(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        self.assertRaises(ValueError, list, read_log(self.path))
+
+    def test_split_commands(self):
+        data = b'use foo\r\nput 1 0 60 7\r\nab\r\ncde\r\ndelete 3\r\n'
+        self.assertEqual(split_commands(data), [
+            b'use foo\r\n', b'put 1 0 60 7\r\nab\r\ncde\r\n', b'delete 3\r\n'])
+
+    def test_command_handler(self):
+        command, _ = command_handler(b'put 5 1 30 3\r\nabc\r\n')
+        self.assertEqual(command, 'put 5 1 30 3\r\nabc\r\n')
+        command, _ = command_handler(b'reserve-with-timeout 4\r\n')
+        self.assertEqual(command, 'reserve-with-timeout 4\r\n')
+
+    def test_replay_against_stand_in(self):
+        records = [
+            (COMMAND, 0.0, b'use foo\r\nput 1 0 60 3\r\nabc\r\n'),
+            (REPLY, 0.001, b'USING foo\r\n'),
+            (REPLY, 0.002, b'INSERTED 1\r\n'),
+            (COMMAND, 0.003, b'reserve\r\n'),
+            (REPLY, 0.004, b'RESERVED 1 3\r\nabc\r\n'),
+        ]
+
+        async def run():
+            server = ReplayServer(records)
+            host, port = await server.start()
+            try:
+                async with connect(host, port) as bs:
+                    return await replay(bs, records, speed=0)
+            finally:
+                await server.close()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats['commands'], 3)
+        self.assertEqual(stats['errors'], 0)
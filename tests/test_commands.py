@@ -117,6 +117,20 @@ command_meta_data = [
             ("KICKED 59\r\n",{'state':'ok', 'count':59})
         ]
     ],
+    [
+        ('process_kick_job', (59,)),
+        'kick-job 59\r\n',
+        [
+            ("KICKED\r\n",{'state':'ok'})
+        ]
+    ],
+    [
+        ('process_pause_tube', ('barbaz', 30)),
+        'pause-tube barbaz 30\r\n',
+        [
+            ("PAUSED\r\n",{'state':'ok'})
+        ]
+    ],
     [
         ('process_stats', ()),
         'stats\r\n',
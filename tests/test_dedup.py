@@ -0,0 +1,114 @@
+import asyncio
+import unittest
+from aiobeanstalk import envelope
+from aiobeanstalk.dedup import BloomFilter, Deduplicator, DedupProducer, \
+    TTLCache, job_key
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBeanstalk:
+
+    def __init__(self):
+        self.jobs = []
+        self.fail = False
+
+    async def put(self, data, pri=1, delay=0, ttr=60):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError('lost')
+        self.jobs.append(data)
+        return {'state': 'ok', 'jid': len(self.jobs)}
+
+
+class DeduplicatorTests(unittest.TestCase):
+
+    def test_ttl_cache_expires(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        clock.now += 10
+        self.assertIsNone(cache.get('a'))
+        for key in 'bcd':
+            cache.set(key, key)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add('key-{}'.format(i))
+        self.assertTrue(all('key-{}'.format(i) in bloom for i in range(1000)))
+        false = sum(1 for i in range(1000) if 'other-{}'.format(i) in bloom)
+        self.assertLess(false, 50)
+
+    def test_bloom_remembers_evicted_keys(self):
+        clock = FakeClock()
+        dedup = Deduplicator(maxsize=1, ttl=10, bloom_capacity=100,
+                             clock=clock)
+        dedup.mark_seen('a', 1)
+        dedup.mark_seen('b', 2)
+        self.assertEqual(dedup.get('b'), 2)
+        self.assertIs(dedup.get('a'), True)
+        clock.now += 15
+        self.assertTrue(dedup.seen('a'))
+        clock.now += 10
+        self.assertFalse(dedup.seen('a'))
+
+    def test_first_seen(self):
+        dedup = Deduplicator()
+        self.assertTrue(dedup.first_seen('a'))
+        self.assertFalse(dedup.first_seen('a'))
+        dedup.forget('a')
+        self.assertTrue(dedup.first_seen('a'))
+
+
+class DedupProducerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.bs = FakeBeanstalk()
+        self.producer = DedupProducer(self.bs)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_duplicates_skipped(self):
+        run = self.loop.run_until_complete
+        first = run(self.producer.put('body', dedup_key='k'))
+        second = run(self.producer.put('body', dedup_key='k'))
+        self.assertEqual(first, {'state': 'ok', 'jid': 1})
+        self.assertEqual(second, {'state': 'duplicate', 'jid': 1})
+        self.assertEqual(len(self.bs.jobs), 1)
+        meta, body = envelope.unpack(self.bs.jobs[0])
+        self.assertEqual((meta, body), ({'dedup': 'k'}, 'body'))
+        self.assertEqual(job_key({'data': self.bs.jobs[0]}), 'k')
+        run(self.producer.put('body'))
+        self.assertEqual(self.bs.jobs[1], 'body')
+
+    def test_concurrent_puts_collapsed(self):
+        async def put_all():
+            return (await asyncio.gather(
+                *[self.producer.put('body', dedup_key='k') for _ in range(3)]))
+
+        replies = self.loop.run_until_complete(put_all())
+        self.assertEqual(len(self.bs.jobs), 1)
+        self.assertEqual(sorted(reply['state'] for reply in replies),
+                         ['duplicate', 'duplicate', 'ok'])
+
+    def test_failed_put_can_be_retried(self):
+        run = self.loop.run_until_complete
+        self.bs.fail = True
+        with self.assertRaises(ConnectionError):
+            run(self.producer.put('body', dedup_key='k'))
+        self.bs.fail = False
+        self.assertEqual(run(self.producer.put('body', dedup_key='k')),
+                         {'state': 'ok', 'jid': 1})
@@ -0,0 +1,23 @@
+import unittest
+from aiobeanstalk import envelope
+
+
+class EnvelopeTests(unittest.TestCase):
+
+    def test_roundtrip(self):
+        data = envelope.pack('{"nice":"job"}\nsecond line', pri=10, ttr=30)
+        meta, body = envelope.unpack(data)
+        self.assertEqual(meta, {'pri': 10, 'ttr': 30})
+        self.assertEqual(body, '{"nice":"job"}\nsecond line')
+
+    def test_no_meta_keeps_body(self):
+        self.assertEqual(envelope.pack('body'), 'body')
+
+    def test_plain_body(self):
+        self.assertEqual(envelope.unpack('plain'), ({}, 'plain'))
+
+    def test_malformed_header(self):
+        data = envelope.HEADER_PREFIX + '{not json\nbody'
+        self.assertEqual(envelope.unpack(data), ({}, data))
+        data = envelope.HEADER_PREFIX + '[1, 2]\nbody'
+        self.assertEqual(envelope.unpack(data), ({}, data))
@@ -0,0 +1,94 @@
+import asyncio
+import collections
+import time
+import unittest
+from aiobeanstalk.exceptions import BSTimedOut
+from aiobeanstalk.fair import FairConsumer
+
+
+class FakeBeanstalk:
+
+    def __init__(self, tube):
+        self.tube = tube
+        self.jobs = collections.deque()
+        self.reserves = 0
+
+    async def reserve_with_timeout(self, timeout=0):
+        self.reserves += 1
+        end = time.monotonic() + timeout
+        while not self.jobs:
+            if time.monotonic() >= end:
+                raise BSTimedOut()
+            await asyncio.sleep(0.01)
+        return {'state': 'ok', 'jid': self.jobs.popleft(), 'data': ''}
+
+
+class FakeMonitor:
+
+    fresh = True
+
+    def __init__(self, tubes):
+        self.tubes = tubes
+
+
+class FairConsumerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def consumer(self, tubes, **kw):
+        consumer = FairConsumer(tubes, **kw)
+        for tube, lane in consumer._lanes.items():
+            lane.bs = FakeBeanstalk(tube)
+        return consumer
+
+    def reserve(self, consumer, count):
+        run = self.loop.run_until_complete
+        return [run(consumer.reserve(timeout=1))['tube']
+                for _ in range(count)]
+
+    def test_weights(self):
+        consumer = self.consumer({'hot': 3, 'cold': 1})
+        for lane in consumer._lanes.values():
+            lane.bs.jobs.extend(range(100))
+        tubes = self.reserve(consumer, 8)
+        self.assertEqual(tubes.count('hot'), 6)
+        self.assertEqual(tubes.count('cold'), 2)
+        # smooth: the cold tube is not served last
+        self.assertIn('cold', tubes[:4])
+
+    def test_empty_tube_does_not_take_turns(self):
+        consumer = self.consumer({'a': 1, 'b': 1})
+        consumer._lanes['a'].bs.jobs.extend(range(5))
+        self.assertEqual(self.reserve(consumer, 5), ['a'] * 5)
+        # b is skipped while it is known to be empty
+        self.assertEqual(consumer._lanes['b'].bs.reserves, 1)
+
+    def test_monitor_skips_empty_tubes(self):
+        monitor = FakeMonitor({'a': {'current-jobs-ready': 3},
+                               'b': {'current-jobs-ready': 0}})
+        consumer = self.consumer({'a': 1, 'b': 1}, monitor=monitor)
+        consumer._lanes['a'].bs.jobs.extend(range(3))
+        self.assertEqual(self.reserve(consumer, 3), ['a'] * 3)
+        self.assertEqual(consumer._lanes['b'].bs.reserves, 0)
+
+    def test_blocks_until_a_job_arrives(self):
+        consumer = self.consumer({'a': 1, 'b': 1}, reserve_timeout=1)
+        self.loop.call_later(0.05, consumer._lanes['b'].bs.jobs.append, 7)
+        job = self.loop.run_until_complete(consumer.reserve(timeout=1))
+        self.assertEqual((job['tube'], job['jid']), ('b', 7))
+        # let the reserve still blocked on tube a time out
+        self.loop.run_until_complete(asyncio.sleep(1.1))
+
+    def test_timeout(self):
+        consumer = self.consumer({'a': 1}, reserve_timeout=1)
+        with self.assertRaises(BSTimedOut):
+            self.loop.run_until_complete(consumer.reserve(timeout=0.05))
+        self.loop.run_until_complete(asyncio.sleep(1.1))
+
+    def test_invalid_weight(self):
+        with self.assertRaises(ValueError):
+            FairConsumer({'a': 0})
@@ -1,7 +1,7 @@
 from functools import partial
 import unittest
 from aiobeanstalk.exceptions import BadFormatException
-from aiobeanstalk.helpers import check_name, int_it
+from aiobeanstalk.helpers import check_name, int_it, parse_address
 
 
 class HelpersTests(unittest.TestCase):
@@ -19,3 +19,25 @@ class HelpersTests(unittest.TestCase):
 
     def test_int_id_not_int(self):
         self.assertEqual(int_it("asyncio"), "asyncio")
+
+
+class ParseAddressTests(unittest.TestCase):
+
+    def test_host_and_port(self):
+        self.assertEqual(parse_address('example.com', 11301),
+                         ('tcp', 'example.com', 11301))
+
+    def test_beanstalk_url(self):
+        self.assertEqual(parse_address('beanstalk://example.com:11400'),
+                         ('tcp', 'example.com', 11400))
+        self.assertEqual(parse_address('beanstalk://example.com', 11301),
+                         ('tcp', 'example.com', 11301))
+
+    def test_unix_socket(self):
+        self.assertEqual(parse_address('unix:///run/beanstalkd.sock'),
+                         ('unix', '/run/beanstalkd.sock'))
+        self.assertEqual(parse_address('/run/beanstalkd.sock'),
+                         ('unix', '/run/beanstalkd.sock'))
+
+    def test_unknown_scheme(self):
+        self.assertRaises(ValueError, parse_address, 'http://example.com')
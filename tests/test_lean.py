@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from aiobeanstalk import handlers
+from aiobeanstalk.exceptions import BSNotFount
+from aiobeanstalk.lean import LeanBeanstalk
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def write(self, data):
+        self.written.append(data)
+
+    def close(self):
+        self.closed = True
+
+
+class LeanBeanstalkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = FakeTransport()
+        self.bs = LeanBeanstalk()
+        self.bs.connection_made(self.transport)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def send(self, *calls):
+        """Issue commands from within the loop, returns their futures."""
+        async def send():
+            return [call() for call in calls]
+        return self.loop.run_until_complete(send())
+
+    def test_no_instance_dict(self):
+        self.assertFalse(hasattr(self.bs, '__dict__'))
+
+    def test_replies_split_across_reads(self):
+        put, reserve = self.send(lambda: self.bs.put('job'), self.bs.reserve)
+        self.assertEqual(self.transport.written,
+                         [b'put 1 0 60 3\r\njob\r\n', b'reserve\r\n'])
+        for chunk in (b'INSERTED 7\r', b'\nRESERVED 7 ', b'3\r\njo',
+                      b'b\r\n'):
+            self.bs.data_received(chunk)
+        self.assertEqual(put.result(), {'state': 'ok', 'jid': 7})
+        self.assertEqual(reserve.result(),
+                         {'state': 'ok', 'jid': 7, 'bytes': 3, 'data': 'job'})
+        # nothing is kept around once the replies are consumed
+        self.assertIsNone(self.bs._conn._buffer)
+        self.assertIsNone(self.bs._conn._pending)
+
+    def test_pipeline_with_errors(self):
+        task = self.loop.create_task(self.bs.pipeline([
+            handlers.process_delete(1), handlers.process_delete(2)],
+            return_exceptions=True))
+        self.loop.call_soon(self.bs.data_received,
+                            b'DELETED\r\nNOT_FOUND\r\n')
+        replies = self.loop.run_until_complete(task)
+        self.assertEqual(replies[0], {'state': 'ok'})
+        self.assertIsInstance(replies[1], BSNotFount)
+        self.assertEqual(len(self.transport.written), 1)
+
+    def test_connection_lost_fails_pending(self):
+        fut, = self.send(self.bs.reserve)
+        self.bs.connection_lost(None)
+        self.assertIsInstance(fut.exception(), ConnectionError)
+        fut, = self.send(self.bs.reserve)
+        self.assertIsInstance(fut.exception(), ConnectionError)
@@ -0,0 +1,53 @@
+import asyncio
+import time
+import unittest
+from aiobeanstalk.exceptions import BSTimedOut
+from aiobeanstalk.prefetch import PrefetchBuffer
+
+
+class FakeBeanstalk:
+
+    def __init__(self):
+        self.commands = []
+
+    async def pipeline(self, commands, return_exceptions=False):
+        self.commands.extend(command for command, _ in commands)
+        return [{'state': 'ok'} for _ in commands]
+
+
+class PrefetchBufferTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.bs = FakeBeanstalk()
+        self.buffer = PrefetchBuffer(self.bs, min_time_left=1.0)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_jobs_are_handed_out_by_priority(self):
+        deadline = time.monotonic() + 60
+        for jid, pri in [(1, 100), (2, 5), (3, 50), (4, 5)]:
+            self.buffer.push({'jid': jid}, pri, deadline)
+        jids = [self.loop.run_until_complete(self.buffer.get())['jid']
+                for _ in range(4)]
+        self.assertEqual(jids, [2, 4, 3, 1])
+        self.assertEqual(self.bs.commands, [])
+
+    def test_jobs_close_to_ttr_are_released(self):
+        now = time.monotonic()
+        self.buffer.push({'jid': 1}, 0, now + 0.5)
+        self.buffer.push({'jid': 2}, 10, now + 60)
+        job = self.loop.run_until_complete(self.buffer.get())
+        self.assertEqual(job['jid'], 2)
+        self.assertEqual(self.bs.commands, ['release 1 0 0\r\n'])
+
+    def test_get_times_out(self):
+        self.assertRaises(BSTimedOut, self.loop.run_until_complete,
+                          self.buffer.get(0.01))
+
+    def test_close_releases_buffered_jobs(self):
+        self.buffer.push({'jid': 7}, 3, time.monotonic() + 60)
+        self.loop.run_until_complete(self.buffer.close())
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.bs.commands, ['release 7 3 0\r\n'])
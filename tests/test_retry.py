@@ -0,0 +1,42 @@
+import unittest
+from aiobeanstalk.retry import AttemptCache, RetryPolicy, MAX_PRIORITY
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def test_delay_grows_exponentially(self):
+        policy = RetryPolicy(base_delay=2, factor=3, max_delay=100)
+        delays = [policy.delay(attempt) for attempt in range(1, 6)]
+        self.assertEqual(delays, [2, 6, 18, 54, 100])
+
+    def test_exhausted(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertFalse(policy.exhausted(2))
+        self.assertTrue(policy.exhausted(3))
+
+    def test_priority_escalates_and_is_clamped(self):
+        policy = RetryPolicy(pri_step=10)
+        self.assertEqual(policy.priority(100, 2), 80)
+        self.assertEqual(policy.priority(5, 2), 0)
+        policy = RetryPolicy(pri_step=-10)
+        self.assertEqual(policy.priority(MAX_PRIORITY, 1), MAX_PRIORITY)
+
+
+class AttemptCacheTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = AttemptCache(maxsize=2)
+        cache.set(1, 1)
+        cache.set(2, 1)
+        cache.get(1)
+        cache.set(3, 1)
+        self.assertIn(1, cache)
+        self.assertNotIn(2, cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_discard(self):
+        cache = AttemptCache()
+        cache.set(1, 4)
+        cache.discard(1)
+        cache.discard(1)
+        self.assertIsNone(cache.get(1))
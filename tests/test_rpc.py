@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from aiobeanstalk import envelope
+from aiobeanstalk.rpc import RpcServer, _Publisher
+
+
+class FakeBeanstalk:
+
+    def __init__(self):
+        self.commands = []
+
+    async def pipeline(self, commands, return_exceptions=False):
+        self.commands.extend(command for command, _ in commands)
+        return [{'state': 'ok'} for _ in commands]
+
+
+class PublisherTests(unittest.TestCase):
+
+    def test_use_is_sent_only_on_tube_switch(self):
+        loop = asyncio.new_event_loop()
+        bs = FakeBeanstalk()
+        publisher = _Publisher(bs)
+        for tube in ('default', 'a', 'a', 'default'):
+            loop.run_until_complete(publisher.put(tube, 'x'))
+        loop.close()
+        self.assertEqual(bs.commands, [
+            'put 1 0 60 1\r\nx\r\n',
+            'use a\r\n', 'put 1 0 60 1\r\nx\r\n',
+            'put 1 0 60 1\r\nx\r\n',
+            'use default\r\n', 'put 1 0 60 1\r\nx\r\n'])
+
+
+class RpcServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = RpcServer('math')
+        self.bs = FakeBeanstalk()
+        self.server._publisher = _Publisher(self.bs)
+
+        @self.server.handler()
+        def double(data):
+            return str(int(data) * 2)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def dispatch(self, body, **meta):
+        self.loop.run_until_complete(self.server._semaphore.acquire())
+        self.loop.run_until_complete(self.server._dispatch(
+            envelope.pack(body, reply_to='replies', **meta)))
+        put_line, data = self.bs.commands[-1].split('\r\n', 1)
+        return envelope.unpack(data[:-len('\r\n')])
+
+    def test_reply_is_sent_to_reply_tube(self):
+        meta, body = self.dispatch('21', cid=3, method='double')
+        self.assertEqual(self.bs.commands[0], 'use replies\r\n')
+        self.assertEqual(meta, {'cid': 3})
+        self.assertEqual(body, '42')
+
+    def test_errors_are_returned(self):
+        meta, _ = self.dispatch('x', cid=4, method='double')
+        self.assertIn('ValueError', meta['error'])
+        meta, _ = self.dispatch('x', cid=5, method='triple')
+        self.assertEqual(meta['error'], 'Unknown method: triple')
+
+    def test_expired_requests_are_dropped(self):
+        self.loop.run_until_complete(self.server._semaphore.acquire())
+        self.loop.run_until_complete(self.server._dispatch(envelope.pack(
+            '1', reply_to='replies', cid=1, method='double', expires=0)))
+        self.assertEqual(self.bs.commands, [])
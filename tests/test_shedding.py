@@ -0,0 +1,57 @@
+import unittest
+from aiobeanstalk.shedding import LoadShedder
+
+
+class FakeClock:
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class LoadShedderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.shedder = LoadShedder(None, ['emails'], max_error_rate=0.5,
+                                   max_latency=2.0, max_reserved=100,
+                                   window=10, min_samples=4, min_pause=1,
+                                   max_pause=4, clock=self.clock)
+
+    def record(self, count, latency=0.1, ok=True):
+        for _ in range(count):
+            self.shedder.record(latency, ok)
+
+    def test_healthy(self):
+        self.record(10)
+        self.assertIsNone(self.shedder.decide(reserved=5))
+
+    def test_too_few_samples(self):
+        self.record(3, ok=False)
+        self.assertIsNone(self.shedder.decide())
+
+    def test_pause_doubles_while_overloaded(self):
+        pauses = []
+        for _ in range(4):
+            self.record(4, ok=False)
+            pauses.append(self.shedder.decide())
+            self.assertIsNone(self.shedder.decide())
+            self.clock.now += self.shedder.pause
+        self.assertEqual(pauses, [1, 2, 4, 4])
+
+    def test_pause_resets_after_healthy_window(self):
+        self.record(4, latency=3.0)
+        self.assertEqual(self.shedder.decide(), 1)
+        self.clock.now += 11
+        self.assertIsNone(self.shedder.decide())
+        self.assertEqual(self.shedder.pause, 0)
+
+    def test_reserved_jobs(self):
+        self.assertEqual(self.shedder.decide(reserved=101), 1)
+
+    def test_old_samples_are_ignored(self):
+        self.record(4, ok=False)
+        self.clock.now += 11
+        self.assertIsNone(self.shedder.decide())
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from aiobeanstalk.spool import Spool
+
+
+class SpoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith('.seg'))
+
+    def test_append_and_read(self):
+        spool = Spool(self.directory)
+        spool.append('first', 10, 0, 30)
+        spool.append('second')
+        records = [record for _, record in spool.read()]
+        self.assertEqual(records, [('first', 10, 0, 30), ('second', 1, 0, 60)])
+        self.assertEqual(len(spool), 2)
+        spool.close()
+
+    def test_ack_survives_reopen(self):
+        spool = Spool(self.directory)
+        for i in range(3):
+            spool.append('job{}'.format(i))
+        position, _ = spool.read(2)[-1]
+        spool.ack(position, 2)
+        spool.close()
+
+        spool = Spool(self.directory)
+        self.assertEqual(len(spool), 1)
+        self.assertEqual(spool.read()[0][1][0], 'job2')
+        spool.close()
+
+    def test_acked_segments_are_removed(self):
+        spool = Spool(self.directory, segment_size=1)
+        for i in range(3):
+            spool.append('job{}'.format(i))
+        self.assertEqual(len(self.segments()), 3)
+        records = spool.read()
+        spool.ack(records[1][0], 2)
+        self.assertEqual(len(self.segments()), 1)
+        self.assertEqual([r for _, r in spool.read()], [('job2', 1, 0, 60)])
+        spool.close()
+
+    def test_torn_record_is_dropped(self):
+        spool = Spool(self.directory)
+        spool.append('complete')
+        spool.append('torn')
+        spool.close()
+        path = os.path.join(self.directory, self.segments()[0])
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 2)
+
+        spool = Spool(self.directory)
+        self.assertEqual(len(spool), 1)
+        spool.append('next')
+        self.assertEqual([r[0] for _, r in spool.read()], ['complete', 'next'])
+        spool.close()
@@ -0,0 +1,23 @@
+import unittest
+from aiobeanstalk.stats import compute_rates, SERVER_RATES, TUBE_RATES
+
+
+class ComputeRatesTests(unittest.TestCase):
+
+    def test_no_previous_snapshot(self):
+        self.assertEqual(compute_rates(None, {'total-jobs': 3}, 1, TUBE_RATES),
+                         {})
+
+    def test_tube_rates(self):
+        prev = {'total-jobs': 10, 'cmd-delete': 4, 'current-jobs-ready': 6}
+        cur = {'total-jobs': 30, 'cmd-delete': 8, 'current-jobs-ready': 2}
+        rates = compute_rates(prev, cur, 2.0, TUBE_RATES)
+        self.assertEqual(rates, {'puts_per_sec': 10.0, 'deletes_per_sec': 2.0,
+                                 'ready_delta': -4})
+
+    def test_summed_counters_and_restart(self):
+        prev = {'cmd-reserve': 5, 'cmd-reserve-with-timeout': 5, 'cmd-put': 9}
+        cur = {'cmd-reserve': 8, 'cmd-reserve-with-timeout': 7, 'cmd-put': 1}
+        rates = compute_rates(prev, cur, 1.0, SERVER_RATES)
+        self.assertEqual(rates['reserves_per_sec'], 5.0)
+        self.assertEqual(rates['puts_per_sec'], 0)
@@ -0,0 +1,24 @@
+import unittest
+from aiobeanstalk.supervisor import aggregate_metrics, import_handler
+
+
+class SupervisorHelpersTests(unittest.TestCase):
+
+    def test_aggregate_metrics(self):
+        metrics = aggregate_metrics([
+            {'processed': 3, 'failed': 1, 'slots': 2, 'latency': 0.2},
+            {'processed': 5, 'failed': 0, 'slots': 4, 'latency': None},
+            {'processed': 1, 'failed': 2, 'slots': 1, 'latency': 0.4},
+        ])
+        self.assertEqual(metrics['processed'], 9)
+        self.assertEqual(metrics['failed'], 3)
+        self.assertEqual(metrics['slots'], 7)
+        self.assertAlmostEqual(metrics['latency'], 0.3)
+
+    def test_aggregate_nothing(self):
+        self.assertEqual(aggregate_metrics([]), {'latency': None})
+
+    def test_import_handler(self):
+        self.assertIs(import_handler('os.path:join'), __import__('os').path.join)
+        self.assertIs(import_handler(len), len)
+        self.assertRaises(ValueError, import_handler, 'os.path.join')
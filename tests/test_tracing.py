@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from aiobeanstalk import envelope
+from aiobeanstalk.tracing import Tracer
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBeanstalk:
+
+    def __init__(self):
+        self.jobs = []
+
+    async def put(self, data, pri=1, delay=0, ttr=60):
+        self.jobs.append(data)
+        return {'state': 'ok', 'jid': len(self.jobs)}
+
+    async def reserve(self):
+        data = self.jobs[0]
+        return {'state': 'ok', 'jid': 1, 'bytes': len(data), 'data': data}
+
+    async def delete(self, jid):
+        return {'state': 'ok'}
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.clock = FakeClock()
+        self.traces = []
+        self.bs = FakeBeanstalk()
+        self.tracer = Tracer(self.bs, producer_id='producer-1',
+                             hook=self.traces.append, clock=self.clock)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_put_stamps_header(self):
+        self.loop.run_until_complete(self.tracer.put('body', trace_id='abc'))
+        meta, body = envelope.unpack(self.bs.jobs[0])
+        self.assertEqual(body, 'body')
+        self.assertEqual(meta, {'ts': 1000.0, 'trace_id': 'abc',
+                                'producer': 'producer-1'})
+
+    def test_timings_reported_on_delete(self):
+        run = self.loop.run_until_complete
+        run(self.tracer.put('body', delay=2, trace_id='abc'))
+        self.clock.now += 5
+        job = run(self.tracer.reserve())
+        self.assertEqual(job['data'], 'body')
+        self.clock.now += 1.5
+        run(self.tracer.delete(job['jid']))
+        self.assertEqual(self.traces, [{
+            'jid': 1, 'trace_id': 'abc', 'producer': 'producer-1',
+            'queue_wait': 3.0, 'processing': 1.5, 'total': 6.5}])
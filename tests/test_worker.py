@@ -0,0 +1,34 @@
+import unittest
+from aiobeanstalk.worker import Worker
+
+
+class WorkerScalingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.worker = Worker(None, min_slots=2, max_slots=10, interval=1.0)
+
+    def test_invalid_limits(self):
+        self.assertRaises(ValueError, Worker, None, min_slots=3, max_slots=2)
+
+    def test_desired_slots_follows_depth_and_latency(self):
+        self.worker.record(0.5)
+        self.assertEqual(self.worker.desired_slots(0), 2)
+        self.assertEqual(self.worker.desired_slots(12), 6)
+        self.assertEqual(self.worker.desired_slots(1000), 10)
+
+    def test_latency_is_smoothed(self):
+        self.worker.record(1.0)
+        self.worker.record(2.0, alpha=0.5)
+        self.assertAlmostEqual(self.worker.latency, 1.5)
+
+    def test_overload_halves_target(self):
+        self.worker.target = 9
+        self.worker.overloaded()
+        self.assertEqual(self.worker.target, 4)
+        self.worker.overloaded()
+        self.worker.overloaded()
+        self.assertEqual(self.worker.target, 2)
+        self.assertEqual(self.worker.metrics['overloads'], 3)
+
+    def test_prefetch_and_batches_are_exclusive(self):
+        self.assertRaises(ValueError, Worker, None, prefetch=4, batch_size=8)